@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+precomputed table of every action on the 8x8 board, each action has a compact
+integer id and one canonical (interned) tuple in the referee format:
+("BOOM", (x, y)) or ("MOVE", n, (x, y), (next_x, next_y))
+
+action ids:
+    0 - 63:   BOOM at square y * 8 + x
+    64 - ...: MOVE n tokens from a square to a square in the same row or column,
+              the ids of the 12 moves between two squares are consecutive
+"""
+
+MAX_STACK = 12
+
+# position tuple of every square index
+POS = tuple((i % 8, i // 8) for i in range(64))
+
+# ACTIONS[action_id]: canonical action tuple
+ACTIONS = []
+
+# ACTION_IDS[action tuple]: action id
+ACTION_IDS = dict()
+
+# BOOM_ACTIONS[(x, y)]: canonical BOOM tuple
+BOOM_ACTIONS = dict()
+
+# MOVE_ACTIONS[(x, y)][(next_x, next_y)]: tuple of canonical MOVE tuples, index n - 1 moves n tokens
+MOVE_ACTIONS = {pos: dict() for pos in POS}
+
+# MOVE_IDS[(x, y)][(next_x, next_y)]: id of the MOVE of 1 token, the MOVE of n tokens is id + n - 1
+MOVE_IDS = {pos: dict() for pos in POS}
+
+
+def _build():
+    for pos in POS:
+        action = ("BOOM", pos)
+        BOOM_ACTIONS[pos] = action
+        ACTION_IDS[action] = len(ACTIONS)
+        ACTIONS.append(action)
+
+    for pos in POS:
+        x, y = pos
+        for step in range(1, 8):
+            for dx, dy in ((0, 1), (0, -1), (1, 0), (-1, 0)):
+                next_pos = (x + dx * step, y + dy * step)
+                if -1 < next_pos[0] < 8 and -1 < next_pos[1] < 8:
+                    MOVE_IDS[pos][next_pos] = len(ACTIONS)
+                    moves = tuple(("MOVE", n, pos, next_pos) for n in range(1, MAX_STACK + 1))
+                    MOVE_ACTIONS[pos][next_pos] = moves
+                    for action in moves:
+                        ACTION_IDS[action] = len(ACTIONS)
+                        ACTIONS.append(action)
+
+
+_build()
+ACTIONS = tuple(ACTIONS)
+
+ACTION_NUM = len(ACTIONS)
+
+
+def action_id(action):
+    """
+    Args:
+        action: action tuple in the referee format
+    Returns:
+        integer action id
+    """
+    return ACTION_IDS[action]
+
+
+def get_action(action_id):
+    """
+    Args:
+        action_id: integer action id
+    Returns:
+        canonical action tuple
+    """
+    return ACTIONS[action_id]
+
+
+def intern_action(action):
+    """
+    canonical tuple of an action, e.g. an action received from the referee
+    Args:
+        action: action tuple in the referee format
+    Returns:
+        the equal canonical action tuple
+    """
+    return ACTIONS[ACTION_IDS[action]]
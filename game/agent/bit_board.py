@@ -0,0 +1,530 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+bitboard implementation of Board, the position is stored as two 64-bit
+occupancy masks (white/black) and a stack height array,
+square index of (x, y) is y * 8 + x
+"""
+
+from agent.board import Board, BoardChange, Cell
+from agent.action_table import ACTION_IDS, BOOM_ACTIONS, MOVE_ACTIONS
+
+# position tuple of every square index
+POS = tuple((i % 8, i // 8) for i in range(64))
+
+FULL_MASK = (1 << 64) - 1
+
+# masks excluding the first and the last column, used when shifting east and west
+NOT_FIRST_COLUMN = sum(1 << i for i in range(64) if i % 8 != 0)
+NOT_LAST_COLUMN = sum(1 << i for i in range(64) if i % 8 != 7)
+
+MAX_STACK = 12
+
+
+def square(x, y):
+    """
+    square index of position (x, y)
+    """
+    return y * 8 + x
+
+
+def dilate(mask):
+    """
+    expand a mask by one square in the 8 surrounding directions
+    Args:
+        mask: square mask
+    Returns:
+        mask including the original squares and all their surrounding squares
+    """
+    row = mask | ((mask << 1) & NOT_FIRST_COLUMN) | ((mask >> 1) & NOT_LAST_COLUMN)
+    return (row | (row << 8) | (row >> 8)) & FULL_MASK
+
+
+def _cardinal_squares(i, n):
+    """
+    squares a stack of height n at square i can move to, in the order of
+    board-util-data.json
+    """
+    x, y = POS[i]
+    squares = []
+    for step in range(1, n + 1):
+        for dx, dy in ((0, 1), (0, -1), (1, 0), (-1, 0)):
+            next_x, next_y = x + dx * step, y + dy * step
+            if -1 < next_x < 8 and -1 < next_y < 8:
+                squares.append(square(next_x, next_y))
+    return squares
+
+
+# per-square neighbour masks
+SURROUND_MASK = tuple(dilate(1 << i) & ~(1 << i) for i in range(64))
+
+# CARDINAL[i][n]: target squares of a stack of height n at square i
+CARDINAL = tuple(tuple(tuple(_cardinal_squares(i, n)) for n in range(MAX_STACK + 1)) for i in range(64))
+
+# CARDINAL_MASK[i][n]: mask of CARDINAL[i][n]
+CARDINAL_MASK = tuple(tuple(sum(1 << j for j in CARDINAL[i][n]) for n in range(MAX_STACK + 1)) for i in range(64))
+
+# zobrist keys indexed by square and stack height, height 0 maps to 0 so empty squares need no special case
+ZOBRIST_WHITE = tuple([0] + Board.ZOBRIST[Board.WHITE][POS[i]][1:] for i in range(64))
+ZOBRIST_BLACK = tuple([0] + Board.ZOBRIST[Board.BLACK][POS[i]][1:] for i in range(64))
+
+
+def iterate_bits(mask):
+    """
+    iterate the square indexes of a mask in ascending order
+    """
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def bit_count(mask):
+    """
+    number of squares in a mask
+    """
+    return bin(mask).count("1")
+
+
+class BitBoard:
+    """
+    board object backed by occupancy masks, same public api as Board
+    """
+    WHITE = Board.WHITE
+    BLACK = Board.BLACK
+
+    def __init__(self, data=None, colour="white"):
+        """
+        Args:
+            data: board json object
+        """
+        self.init_self_data(colour)
+
+        # the steps have been taken
+        self.cost = 0
+
+        # occupancy masks and stack height of every square
+        self.white = 0
+        self.black = 0
+        self.heights = bytearray(64)
+
+        # token numbers of both colours
+        self.white_token_num = 0
+        self.black_token_num = 0
+
+        # zobrist key, same keys as Board so equal positions share a key
+        self.key = 0
+
+        # cached dict of cells and list of partitions, rebuilt after the board changes
+        self._cells = None
+        self._partitions = None
+
+        # callbacks notified of every change, see Board.subscribe
+        self.listeners = []
+
+        # analysis of the board state, see BoardUtil.analyse
+        self.analysis = None
+
+        # initialize board data
+        if data is not None:
+            for token in data["white"]:
+                n, x, y = token[0], token[1], token[2]
+                i = square(x, y)
+                self.white |= 1 << i
+                self.heights[i] = n
+                self.white_token_num += n
+                self.key ^= ZOBRIST_WHITE[i][n]
+
+            for token in data["black"]:
+                n, x, y = token[0], token[1], token[2]
+                i = square(x, y)
+                self.black |= 1 << i
+                self.heights[i] = n
+                self.black_token_num += n
+                self.key ^= ZOBRIST_BLACK[i][n]
+
+    init_self_data = Board.init_self_data
+    subscribe = Board.subscribe
+    unsubscribe = Board.unsubscribe
+    notify = Board.notify
+
+    @property
+    def board(self):
+        """
+        dict of all not-empty cells, key: (x, y) value: Cell(), for BoardUtil
+        """
+        if self._cells is None:
+            self._cells = {POS[i]: self._cell(i) for i in iterate_bits(self.white | self.black)}
+        return self._cells
+
+    def _cell(self, i):
+        """
+        create a Cell object of an occupied square
+        """
+        x, y = POS[i]
+        colour = Board.WHITE if self.white >> i & 1 else Board.BLACK
+        return Cell(x, y, self.heights[i], colour)
+
+    def _own_mask(self):
+        return self.white if self.colour == Board.WHITE else self.black
+
+    def _opponent_mask(self):
+        return self.black if self.colour == Board.WHITE else self.white
+
+    def take_action(self, action, undoable=False):
+        """
+        pre-condition: action is valid
+        move or boom a token(stack)
+        Args:
+            action: action tuple
+            undoable: whether to record the state needed to undo the action
+        Returns:
+            undo record for BitBoard.undo if undoable, otherwise None
+        """
+        record = None
+        if undoable:
+            record = (self.cost, self.key, self.white, self.black, bytes(self.heights),
+                      self.white_token_num, self.black_token_num)
+
+        self.cost += 1
+        if action[0] == "BOOM":
+            x, y = action[1]
+            self.boom(x, y)
+        else:
+            x, y = action[2]
+            next_x, next_y = action[3]
+            self.move(action[1], x, y, next_x, next_y)
+        return record
+
+    def undo(self, record):
+        """
+        restore the exact state before an action
+        Args:
+            record: undo record returned by take_action
+        """
+        occupied, old_heights = self.white | self.black, bytes(self.heights)
+        self.cost, self.key, self.white, self.black, heights, self.white_token_num, self.black_token_num = record
+        self.heights[:] = heights
+        self._cells = None
+        self._partitions = None
+
+        if self.listeners:
+            vacated = [POS[i] for i in iterate_bits(occupied & ~(self.white | self.black))]
+            changed = [POS[i] for i in iterate_bits(self.white | self.black) if heights[i] != old_heights[i]]
+            self.notify(BoardChange(vacated=vacated, changed=changed))
+
+    def move(self, n, x, y, next_x, next_y):
+        """
+        pre-condition: the move is valid
+        a token at (x,y) moves to (next_x, next_y)
+        """
+        i, j = square(x, y), square(next_x, next_y)
+        is_white = self.white >> i & 1
+        keys = ZOBRIST_WHITE if is_white else ZOBRIST_BLACK
+        self.key ^= keys[i][self.heights[i]] ^ keys[j][self.heights[j]]
+        self.heights[i] -= n
+        self.heights[j] += n
+        self.key ^= keys[i][self.heights[i]] ^ keys[j][self.heights[j]]
+
+        if is_white:
+            self.white |= 1 << j
+            if not self.heights[i]:
+                self.white ^= 1 << i
+        else:
+            self.black |= 1 << j
+            if not self.heights[i]:
+                self.black ^= 1 << i
+        self._cells = None
+        self._partitions = None
+
+        if self.listeners:
+            if self.heights[i]:
+                self.notify(BoardChange(changed=[(x, y), (next_x, next_y)]))
+            else:
+                self.notify(BoardChange(vacated=[(x, y)], changed=[(next_x, next_y)]))
+
+    def boom(self, x, y):
+        """
+        pre-condition: (x, y) has token
+        a token or stack boom at (x, y)
+        """
+        region = self.get_connected_mask(square(x, y))
+        for i in iterate_bits(region & self.white):
+            self.white_token_num -= self.heights[i]
+            self.key ^= ZOBRIST_WHITE[i][self.heights[i]]
+            self.heights[i] = 0
+        for i in iterate_bits(region & self.black):
+            self.black_token_num -= self.heights[i]
+            self.key ^= ZOBRIST_BLACK[i][self.heights[i]]
+            self.heights[i] = 0
+
+        self.white &= ~region
+        self.black &= ~region
+        self._cells = None
+        self._partitions = None
+
+        if self.listeners:
+            self.notify(BoardChange(exploded=[POS[i] for i in iterate_bits(region)]))
+
+    def get_connected_mask(self, i):
+        """
+        pre-condition: square i has token
+        flood fill the mask of the squares that would be boomed if square i booms
+        """
+        occupied = self.white | self.black
+        region = 1 << i
+        while True:
+            expanded = dilate(region) & occupied
+            if expanded == region:
+                return region
+            region = expanded
+
+    def get_partitions(self):
+        """
+        get all partitions, see Board.get_partitions
+        Returns:
+            list of partitions, must not be modified
+        """
+        if self._partitions is None:
+            self._partitions = []
+            cells = self.board
+            remaining = self.white | self.black
+            while remaining:
+                region = self.get_connected_mask((remaining & -remaining).bit_length() - 1)
+                remaining &= ~region
+                self._partitions.append({
+                    "cells": {POS[i]: cells[POS[i]] for i in iterate_bits(region)},
+                    Board.WHITE: sum([self.heights[i] for i in iterate_bits(region & self.white)]),
+                    Board.BLACK: sum([self.heights[i] for i in iterate_bits(region & self.black)])
+                })
+        return self._partitions
+
+    def get_connected_cells(self, x, y):
+        """
+        pre-condition: (x, y) has token
+        get all spots that would be boomed if (x, y) booms
+        """
+        return [self._cell(i) for i in iterate_bits(self.get_connected_mask(square(x, y)))]
+
+    def get_action_key(self, action):
+        """
+        pre-condition: action is valid
+        zobrist key of the board after taking an action, see Board.get_action_key
+        """
+        key = self.key
+        heights = self.heights
+        if action[0] == "BOOM":
+            region = self.get_connected_mask(square(*action[1]))
+            for i in iterate_bits(region & self.white):
+                key ^= ZOBRIST_WHITE[i][heights[i]]
+            for i in iterate_bits(region & self.black):
+                key ^= ZOBRIST_BLACK[i][heights[i]]
+            return key
+
+        n = action[1]
+        i, j = square(*action[2]), square(*action[3])
+        keys = ZOBRIST_WHITE if self.white >> i & 1 else ZOBRIST_BLACK
+        return key ^ keys[i][heights[i]] ^ keys[j][heights[j]] ^ keys[i][heights[i] - n] ^ keys[j][heights[j] + n]
+
+    def get_valid_actions(self):
+        """
+        find all valid actions in a single turn,
+        include all valid moves and boom
+        """
+        return list(self.iter_valid_actions())
+
+    def iter_valid_actions(self, order=None):
+        """
+        lazily generate the valid actions in a single turn, the board must be
+        unchanged (or restored by undo) whenever the generator resumes
+        Args:
+            order: Board.BOARD_ORDER or Board.PRIORITY_ORDER, see Board.iter_valid_actions
+        Returns:
+            generator of action tuples
+        """
+        squares = [(i, self.heights[i]) for i in iterate_bits(self._own_mask())]
+
+        if order == Board.PRIORITY_ORDER:
+            for i, n in squares:
+                yield BOOM_ACTIONS[POS[i]]
+
+            targets = [(i, n, self.get_move_targets(i, n)) for i, n in squares]
+            for i, n, next_squares in targets:
+                for j in next_squares:
+                    yield MOVE_ACTIONS[POS[i]][POS[j]][n - 1]
+
+            for k in range(max([n for i, n in squares], default=1) - 1, 0, -1):
+                for i, n, next_squares in targets:
+                    if n > k:
+                        for j in next_squares:
+                            yield MOVE_ACTIONS[POS[i]][POS[j]][k - 1]
+            return
+
+        for i, n in squares:
+            # boom at this position
+            yield BOOM_ACTIONS[POS[i]]
+
+            # find all valid moves
+            moves = MOVE_ACTIONS[POS[i]]
+            for j in self.get_move_targets(i, n):
+                yield from moves[POS[j]][:n]
+
+    def get_valid_action_ids(self, order=None):
+        """
+        integer ids of the valid actions, see agent.action_table
+        Args:
+            order: order of the actions, see Board.iter_valid_actions
+        Returns:
+            list of action ids
+        """
+        return [ACTION_IDS[action] for action in self.iter_valid_actions(order)]
+
+    def get_move_targets(self, i, n):
+        """
+        squares a stack of height n at square i can move to, destination must not be occupied by opponent
+        Returns:
+            list of square indexes
+        """
+        targets = CARDINAL_MASK[i][n] & ~self._opponent_mask()
+        return [j for j in CARDINAL[i][n] if targets >> j & 1]
+
+    def get_white_cells(self):
+        """
+        get white cell list
+        Returns:
+            list of white cell
+        """
+        return [self._cell(i) for i in iterate_bits(self.white)]
+
+    def get_black_cells(self):
+        """
+        get black cell list
+        Returns:
+            list of black cell
+        """
+        return [self._cell(i) for i in iterate_bits(self.black)]
+
+    def white_token_cell_num(self):
+        """
+        get a tuple of the number of white tokens and white cells
+        Returns:
+            tuple (token_num, cell_num)
+        """
+        return self.white_token_num, bit_count(self.white)
+
+    def black_token_cell_num(self):
+        """
+        get a tuple of the number of black tokens and black cells
+        Returns:
+            tuple (token_num, cell_num)
+        """
+        return self.black_token_num, bit_count(self.black)
+
+    def get_own_cells(self):
+        """
+        get own cells
+        Returns:
+            list of own cell
+        """
+        return self.get_white_cells() if self.colour == Board.WHITE else self.get_black_cells()
+
+    def get_opponent_cells(self):
+        """
+        get opponents cells
+        Returns:
+            list of opponent cell
+        """
+        return self.get_white_cells() if self.colour == Board.BLACK else self.get_black_cells()
+
+    def own_token_cell_num(self):
+        """
+        get number of own tokens and cells
+        Returns:
+            tuple (token_num, cell_num)
+        """
+        return self.white_token_cell_num() if self.colour == Board.WHITE else self.black_token_cell_num()
+
+    def opponent_token_cell_num(self):
+        """
+        get number of opponent tokens and cells
+        Returns:
+            tuple (token_num, cell_num)
+        """
+        return self.white_token_cell_num() if self.colour == Board.BLACK else self.black_token_cell_num()
+
+    def to_bytes(self):
+        """
+        fixed-size encoding of the board, the same bytes as Board.to_bytes
+        Returns:
+            bytes object, can be used as a cache key
+        """
+        data = bytearray(self.heights)
+        for i in iterate_bits(self.black):
+            data[i] = 256 - data[i]
+        data.append(0 if self.colour == Board.WHITE else 1)
+        data += self.cost.to_bytes(2, "big")
+        return bytes(data)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        decode a board encoded by to_bytes or Board.to_bytes
+        Args:
+            data: bytes of Board.BYTES_LENGTH
+        Returns:
+            board object
+        """
+        board = cls(None, Board.WHITE if data[64] == 0 else Board.BLACK)
+        board.cost = int.from_bytes(data[65:67], "big")
+        for i in range(64):
+            if data[i]:
+                if data[i] < 128:
+                    board.white |= 1 << i
+                    board.heights[i] = data[i]
+                    board.white_token_num += data[i]
+                    board.key ^= ZOBRIST_WHITE[i][data[i]]
+                else:
+                    board.black |= 1 << i
+                    board.heights[i] = 256 - data[i]
+                    board.black_token_num += 256 - data[i]
+                    board.key ^= ZOBRIST_BLACK[i][256 - data[i]]
+        return board
+
+    def copy(self):
+        board = BitBoard.__new__(BitBoard)
+        board.colour = self.colour
+        board.opponent_colour = self.opponent_colour
+        board.bottom_row = self.bottom_row
+        board.second_bottom_row = self.second_bottom_row
+        board.half_range = self.half_range
+        board.cost = self.cost
+        board.white = self.white
+        board.black = self.black
+        board.heights = bytearray(self.heights)
+        board.white_token_num = self.white_token_num
+        board.black_token_num = self.black_token_num
+        board.key = self.key
+        board._cells = None
+        board._partitions = None
+        board.listeners = []
+        board.analysis = None
+        return board
+
+    def __deepcopy__(self, mem=None):
+        """
+        deep copy of the board object
+        """
+        return self.copy()
+
+    def __hash__(self):
+        return self.key
+
+    def __repr__(self):
+        return str(sorted(self.board.items(), key=lambda t: t[1]))
+
+    def __lt__(self, other):
+        return False
+
+    def __eq__(self, other):
+        return isinstance(other, BitBoard) and self.key == other.key and self.white == other.white \
+            and self.black == other.black and self.heights == other.heights
@@ -5,7 +5,9 @@ define data structure of Board and Cell and static utility methods
 """
 
 from copy import deepcopy
+import random
 from agent.board_util import BoardUtil
+from agent.action_table import ACTION_IDS, BOOM_ACTIONS, MOVE_ACTIONS
 
 
 class Cell:
@@ -33,6 +35,34 @@ class Cell:
         return type(self)(self.x, self.y, self.n, self.colour)
 
 
+class BoardChange:
+    """
+    squares changed by a move, boom or undo, sent to the listeners of a board
+    """
+    def __init__(self, vacated=(), changed=(), exploded=()):
+        # positions that became empty by a move or an undo
+        self.vacated = vacated
+        # positions whose stack was created or changed
+        self.changed = changed
+        # positions removed by a boom chain
+        self.exploded = exploded
+
+    def __repr__(self):
+        return "vacated: " + str(self.vacated) + " changed: " + str(self.changed) + " exploded: " + str(self.exploded)
+
+
+def _zobrist_table(seed):
+    """
+    random 64-bit keys of every (colour, position, stack height),
+    a fixed seed keeps the keys stable between runs and processes
+    Returns:
+        dict, key: colour, value: dict of key: (x, y), value: list of keys indexed by stack height
+    """
+    generator = random.Random(seed)
+    return {colour: {(x, y): [generator.getrandbits(64) for n in range(13)] for x in range(8) for y in range(8)}
+            for colour in ("white", "black")}
+
+
 class Board:
     """
     board object
@@ -40,6 +70,17 @@ class Board:
     WHITE = "white"
     BLACK = "black"
 
+    # bytes of Board.to_bytes: 64 squares (signed token number, positive for white),
+    # own colour (0 for white, 1 for black) and cost (2 bytes, big endian)
+    BYTES_LENGTH = 67
+
+    # orders of Board.iter_valid_actions
+    BOARD_ORDER = "board"
+    PRIORITY_ORDER = "priority"
+
+    # zobrist keys for incremental hashing
+    ZOBRIST = _zobrist_table(20200517)
+
     def __init__(self, data=None, colour="white"):
         """
         Args:
@@ -63,6 +104,168 @@ class Board:
                 n, x, y = token[0], token[1], token[2]
                 self.board[(x, y)] = Cell(x, y, n, Board.BLACK)
 
+        # zobrist key of the board, updated on every move and boom
+        self.key = 0
+        for cell in self.board.values():
+            self.key ^= Board.ZOBRIST[cell.colour][cell.pos][cell.n]
+
+        self.index_cells()
+        self.index_partitions()
+
+        # callbacks notified of every change, see Board.subscribe
+        self.listeners = []
+
+        # analysis of the board state, see BoardUtil.analyse
+        self.analysis = None
+
+    def subscribe(self, listener):
+        """
+        register a callback that is called with (board, BoardChange) after every move, boom and undo,
+        so that derived structures can be updated in O(changed squares), copies have no listeners
+        Args:
+            listener: callable
+        """
+        self.listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        """
+        remove a callback registered by subscribe
+        """
+        self.listeners.remove(listener)
+
+    def notify(self, change):
+        """
+        send a change to all listeners
+        Args:
+            change: BoardChange object
+        """
+        for listener in self.listeners:
+            listener(self, change)
+
+    def index_cells(self):
+        """
+        build the colour indexes from self.board, they are then kept up to date by move and boom
+        """
+        # cells of each colour in the same order as self.board, key: colour value: dict of key: (x, y) value: Cell()
+        self.colour_cells = {Board.WHITE: dict(), Board.BLACK: dict()}
+        # number of tokens of each colour
+        self.token_num = {Board.WHITE: 0, Board.BLACK: 0}
+
+        for pos, cell in self.board.items():
+            self.colour_cells[cell.colour][pos] = cell
+            self.token_num[cell.colour] += cell.n
+
+    def index_partitions(self):
+        """
+        build the partition index from self.board, it is then kept up to date by move, boom and undo,
+        a partition is a group of 8-connected cells that will boom together
+        """
+        # partition id of every not-empty cell, key: (x, y) value: partition id
+        self.partition_of = dict()
+        # key: partition id, value: {"cells": {(x, y): Cell()}, "white": <token_num>, "black": <token_num>}
+        self.partitions = dict()
+        self.next_partition_id = 0
+
+        for pos in self.board:
+            if pos not in self.partition_of:
+                self._new_partition(self._connected(pos, self.board))
+
+    @staticmethod
+    def _connected(pos, cells):
+        """
+        flood fill the cells connected to pos
+        Args:
+            pos: start position, must be in cells
+            cells: dict of cells to search in, key: (x, y) value: Cell()
+        Returns:
+            dict of connected cells, key: (x, y) value: Cell()
+        """
+        connected = {pos: cells[pos]}
+        stack = [pos]
+        while stack:
+            for next_pos in BoardUtil.surround[stack.pop()]:
+                if next_pos in cells and next_pos not in connected:
+                    connected[next_pos] = cells[next_pos]
+                    stack.append(next_pos)
+        return connected
+
+    def _new_partition(self, cells):
+        """
+        add a partition of connected cells to the partition index
+        """
+        partition_id = self.next_partition_id
+        self.next_partition_id += 1
+
+        partition = {"cells": cells, Board.WHITE: 0, Board.BLACK: 0}
+        for pos, cell in cells.items():
+            self.partition_of[pos] = partition_id
+            partition[cell.colour] += cell.n
+        self.partitions[partition_id] = partition
+
+    def _partition_add(self, cell):
+        """
+        add a new cell to the partition index, merging the partitions it connects
+        """
+        partition_ids = {self.partition_of[pos] for pos in BoardUtil.surround[cell.pos] if pos in self.partition_of}
+        if not partition_ids:
+            self._new_partition({cell.pos: cell})
+            return
+
+        # merge the smaller partitions into the largest one
+        partition_id = max(partition_ids, key=lambda i: len(self.partitions[i]["cells"]))
+        partition = self.partitions[partition_id]
+        for other_id in partition_ids:
+            if other_id != partition_id:
+                other = self.partitions.pop(other_id)
+                for pos, other_cell in other["cells"].items():
+                    self.partition_of[pos] = partition_id
+                    partition["cells"][pos] = other_cell
+                partition[Board.WHITE] += other[Board.WHITE]
+                partition[Board.BLACK] += other[Board.BLACK]
+
+        self.partition_of[cell.pos] = partition_id
+        partition["cells"][cell.pos] = cell
+        partition[cell.colour] += cell.n
+
+    def _partition_remove(self, cell):
+        """
+        remove a cell from the partition index, splitting its partition if it is disconnected
+        """
+        partition_id = self.partition_of.pop(cell.pos)
+        partition = self.partitions[partition_id]
+        cells = partition["cells"]
+        del cells[cell.pos]
+        partition[cell.colour] -= cell.n
+
+        if not cells:
+            del self.partitions[partition_id]
+            return
+
+        # a cell with less than 2 neighbours can't be the only link between other cells
+        neighbours = [pos for pos in BoardUtil.surround[cell.pos] if pos in cells]
+        if len(neighbours) < 2 or len(self._connected(neighbours[0], cells)) == len(cells):
+            return
+
+        del self.partitions[partition_id]
+        while cells:
+            part = self._connected(next(iter(cells)), cells)
+            for pos in part:
+                del cells[pos]
+            self._new_partition(part)
+
+    def get_partitions(self):
+        """
+        get all partitions, each partition has the following structure
+        {
+          "cells": {(x, y): Cell()},  # cells in partition
+          "black": <black_token_number>
+          "white": <white_token_number>
+        }
+        Returns:
+            list of partitions, must not be modified
+        """
+        return list(self.partitions.values())
+
     def init_self_data(self, colour):
         if colour == "white":
             self.colour = Board.WHITE
@@ -77,21 +280,66 @@ class Board:
             self.second_bottom_row = 6
             self.half_range = (4, 7)
 
-    def take_action(self, action):
+    def take_action(self, action, undoable=False):
         """
         pre-condition: action is valid
         move or boom a token(stack)
         Args:
             action: tuple (n, x, y, nextX, nextY)
+            undoable: whether to record the state needed to undo the action
+        Returns:
+            undo record for Board.undo if undoable, otherwise None
         """
+        record = (self.cost, self.key, tuple(self.board), [], []) if undoable else None
+
         self.cost += 1
         if action[0] == "BOOM":
             x, y = action[1]
-            self.boom(x, y)
+            cells = self.boom(x, y)
+            if undoable:
+                record[3].extend((cell, cell.n) for cell in cells)
         else:
             x, y = action[2]
             next_x, next_y = action[3]
+            if undoable:
+                # cells that will be changed with their token numbers before the move
+                record[3].append((self.board[(x, y)], self.board[(x, y)].n))
+                if (next_x, next_y) in self.board:
+                    record[3].append((self.board[(next_x, next_y)], self.board[(next_x, next_y)].n))
+                else:
+                    record[4].append((next_x, next_y))
             self.move(action[1], x, y, next_x, next_y)
+        return record
+
+    def undo(self, record):
+        """
+        restore the exact state before an action, including the order of the cells
+        Args:
+            record: undo record returned by take_action
+        """
+        self.cost, self.key, order, changed, created = record
+        board = self.board
+
+        for pos in created:
+            self._partition_remove(board[pos])
+
+        cells = dict()
+        for cell, n in changed:
+            if cell.pos in board:
+                # still on the board with a different token number
+                self.partitions[self.partition_of[cell.pos]][cell.colour] += n - cell.n
+                cell.n = n
+            else:
+                cell.n = n
+                self._partition_add(cell)
+            cells[cell.pos] = cell
+
+        # cells created by the action are dropped, removed cells are put back in place
+        self.board = {pos: cells[pos] if pos in cells else board[pos] for pos in order}
+        self.index_cells()
+
+        if self.listeners:
+            self.notify(BoardChange(vacated=[pos for pos in board if pos not in self.board], changed=list(cells)))
 
     def move(self, n, x, y, next_x, next_y):
         """
@@ -100,69 +348,155 @@ class Board:
         """
         start_cell = self.board[(x, y)]
         des_cell = self.board.get((next_x, next_y), Cell(next_x, next_y, 0, start_cell.colour))
+        keys = Board.ZOBRIST[start_cell.colour]
 
         # update destination cell
-        des_cell.n += n
+        if des_cell.n:
+            self.key ^= keys[des_cell.pos][des_cell.n]
+            self.partitions[self.partition_of[des_cell.pos]][des_cell.colour] += n
+            des_cell.n += n
+        else:
+            des_cell.n = n
+            self._partition_add(des_cell)
+        self.key ^= keys[des_cell.pos][des_cell.n]
         self.board[(next_x, next_y)] = des_cell
+        self.colour_cells[des_cell.colour][(next_x, next_y)] = des_cell
 
         # update start cell
+        self.key ^= keys[start_cell.pos][start_cell.n]
         if start_cell.n == n:
             self.board.pop((x, y))
+            self.colour_cells[start_cell.colour].pop((x, y))
+            self._partition_remove(start_cell)
+            if self.listeners:
+                self.notify(BoardChange(vacated=[(x, y)], changed=[(next_x, next_y)]))
         else:
             start_cell.n -= n
+            self.key ^= keys[start_cell.pos][start_cell.n]
+            self.partitions[self.partition_of[start_cell.pos]][start_cell.colour] -= n
+            if self.listeners:
+                self.notify(BoardChange(changed=[(x, y), (next_x, next_y)]))
 
     def boom(self, x, y):
         """
         pre-condition: (x, y) has token
         a token or stack boom at (x, y)
+        Returns:
+            list of boomed cells
         """
-        for cell in self.get_connected_cells(x, y):
+        # the boom removes the whole partition
+        cells = list(self.partitions.pop(self.partition_of[(x, y)])["cells"].values())
+        for cell in cells:
+            self.key ^= Board.ZOBRIST[cell.colour][cell.pos][cell.n]
             self.board.pop(cell.pos)
+            self.partition_of.pop(cell.pos)
+            self.colour_cells[cell.colour].pop(cell.pos)
+            self.token_num[cell.colour] -= cell.n
+
+        if self.listeners:
+            self.notify(BoardChange(exploded=[cell.pos for cell in cells]))
+        return cells
 
     def get_connected_cells(self, x, y):
         """
         pre-condition: (x, y) has token
         get all spots that would be boomed if (x, y) booms
         """
-        cells = []
-        visited = set()
-
-        def recursive_search(x1, y1):
-            """
-            find all the cells that will boom in recursion
-            """
-            cells.append(self.board[(x1, y1)])
-            visited.add((x1, y1))
+        return list(self.partitions[self.partition_of[(x, y)]]["cells"].values())
 
-            for (next_x, next_y) in BoardUtil.surround[(x1, y1)]:
-                if (next_x, next_y) in self.board and (next_x, next_y) not in visited:
-                    recursive_search(next_x, next_y)
-
-        recursive_search(x, y)
-        return cells
+    def get_action_key(self, action):
+        """
+        pre-condition: action is valid
+        zobrist key of the board after taking an action, without taking it
+        Args:
+            action: action tuple
+        Returns:
+            key of the next board
+        """
+        key = self.key
+        if action[0] == "BOOM":
+            for cell in self.partitions[self.partition_of[action[1]]]["cells"].values():
+                key ^= Board.ZOBRIST[cell.colour][cell.pos][cell.n]
+            return key
+
+        n, pos, next_pos = action[1], action[2], action[3]
+        start_cell = self.board[pos]
+        keys = Board.ZOBRIST[start_cell.colour]
+        key ^= keys[pos][start_cell.n]
+        if start_cell.n > n:
+            key ^= keys[pos][start_cell.n - n]
+        if next_pos in self.board:
+            des_n = self.board[next_pos].n
+            key ^= keys[next_pos][des_n] ^ keys[next_pos][des_n + n]
+        else:
+            key ^= keys[next_pos][n]
+        return key
 
     def get_valid_actions(self):
         """
         find all valid actions in a single turn,
         include all valid moves and boom
         """
+        return list(self.iter_valid_actions())
+
+    def iter_valid_actions(self, order=None):
+        """
+        lazily generate the valid actions in a single turn, the board must be
+        unchanged (or restored by undo) whenever the generator resumes
+        Args:
+            order: Board.BOARD_ORDER for the order of get_valid_actions,
+                Board.PRIORITY_ORDER for booms first, then full-stack moves,
+                then partial splits from the largest to the smallest
+        Returns:
+            generator of action tuples
+        """
         cells = self.get_own_cells()
-        actions = []
 
-        # find all moves
-        for cell in cells:
-            x, y = cell.pos
-            n, color = cell.n, cell.colour
+        if order == Board.PRIORITY_ORDER:
+            for cell in cells:
+                yield BOOM_ACTIONS[cell.pos]
 
+            targets = [(cell, self.get_move_targets(cell)) for cell in cells]
+            for cell, next_positions in targets:
+                for next_pos in next_positions:
+                    yield MOVE_ACTIONS[cell.pos][next_pos][cell.n - 1]
+
+            for i in range(max([cell.n for cell in cells], default=1) - 1, 0, -1):
+                for cell, next_positions in targets:
+                    if cell.n > i:
+                        for next_pos in next_positions:
+                            yield MOVE_ACTIONS[cell.pos][next_pos][i - 1]
+            return
+
+        for cell in cells:
             # boom at this position
-            actions.append(("BOOM", (x, y)))
+            yield BOOM_ACTIONS[cell.pos]
 
             # find all valid moves
-            for (next_x, next_y) in BoardUtil.cardinal[(x, y)][n]:
-                if (next_x, next_y) not in self.board or color == self.board[(next_x, next_y)].colour:
-                    actions += [("MOVE", i, (x, y), (next_x, next_y)) for i in range(1, n + 1)]
+            moves = MOVE_ACTIONS[cell.pos]
+            for next_pos in self.get_move_targets(cell):
+                yield from moves[next_pos][:cell.n]
 
-        return actions
+    def get_valid_action_ids(self, order=None):
+        """
+        integer ids of the valid actions, see agent.action_table
+        Args:
+            order: order of the actions, see Board.iter_valid_actions
+        Returns:
+            list of action ids
+        """
+        return [ACTION_IDS[action] for action in self.iter_valid_actions(order)]
+
+    def get_move_targets(self, cell):
+        """
+        positions a cell can move to, not occupied by the opponent
+        Args:
+            cell: own cell
+        Returns:
+            list of positions
+        """
+        return [pos for pos in BoardUtil.cardinal[cell.pos][cell.n]
+                if pos not in self.board or cell.colour == self.board[pos].colour]
 
     def get_white_cells(self):
         """
@@ -170,7 +504,7 @@ class Board:
         Returns:
             list of white cell
         """
-        return list(filter(lambda cell: cell.colour == Board.WHITE, self.board.values()))
+        return list(self.colour_cells[Board.WHITE].values())
 
     def get_black_cells(self):
         """
@@ -178,7 +512,7 @@ class Board:
         Returns:
             list of black cell
         """
-        return list(filter(lambda cell: cell.colour == Board.BLACK, self.board.values()))
+        return list(self.colour_cells[Board.BLACK].values())
 
     def white_token_cell_num(self):
         """
@@ -186,8 +520,7 @@ class Board:
         Returns:
             tuple (token_num, cell_num)
         """
-        white_cells = self.get_white_cells()
-        return sum([cell.n for cell in white_cells]), len(white_cells)
+        return self.token_num[Board.WHITE], len(self.colour_cells[Board.WHITE])
 
     def black_token_cell_num(self):
         """
@@ -195,8 +528,7 @@ class Board:
         Returns:
             tuple (token_num, cell_num)
         """
-        black_cells = self.get_black_cells()
-        return sum([cell.n for cell in black_cells]), len(black_cells)
+        return self.token_num[Board.BLACK], len(self.colour_cells[Board.BLACK])
 
     def get_own_cells(self):
         """
@@ -204,7 +536,7 @@ class Board:
         Returns:
             list of own cell
         """
-        return self.get_white_cells() if self.colour == Board.WHITE else self.get_black_cells()
+        return list(self.colour_cells[self.colour].values())
 
     def get_opponent_cells(self):
         """
@@ -212,7 +544,7 @@ class Board:
         Returns:
             list of opponent cell
         """
-        return self.get_white_cells() if self.colour == Board.BLACK else self.get_black_cells()
+        return list(self.colour_cells[self.opponent_colour].values())
 
     def own_token_cell_num(self):
         """
@@ -220,7 +552,7 @@ class Board:
         Returns:
             tuple (token_num, cell_num)
         """
-        return self.white_token_cell_num() if self.colour == Board.WHITE else self.black_token_cell_num()
+        return self.token_num[self.colour], len(self.colour_cells[self.colour])
 
     def opponent_token_cell_num(self):
         """
@@ -228,7 +560,42 @@ class Board:
         Returns:
             tuple (token_num, cell_num)
         """
-        return self.white_token_cell_num() if self.colour == Board.BLACK else self.black_token_cell_num()
+        return self.token_num[self.opponent_colour], len(self.colour_cells[self.opponent_colour])
+
+    def to_bytes(self):
+        """
+        fixed-size encoding of the board, see Board.BYTES_LENGTH
+        Returns:
+            bytes object, can be used as a cache key
+        """
+        data = bytearray(Board.BYTES_LENGTH)
+        for cell in self.board.values():
+            # signed byte, positive for white, negative for black
+            data[cell.y * 8 + cell.x] = cell.n if cell.colour == Board.WHITE else 256 - cell.n
+        data[64] = 0 if self.colour == Board.WHITE else 1
+        data[65:67] = self.cost.to_bytes(2, "big")
+        return bytes(data)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        decode a board encoded by to_bytes, cells are created in square order
+        Args:
+            data: bytes of Board.BYTES_LENGTH
+        Returns:
+            board object
+        """
+        tokens = {Board.WHITE: [], Board.BLACK: []}
+        for i in range(64):
+            if data[i]:
+                if data[i] < 128:
+                    tokens[Board.WHITE].append([data[i], i % 8, i // 8])
+                else:
+                    tokens[Board.BLACK].append([256 - data[i], i % 8, i // 8])
+
+        board = cls(tokens, Board.WHITE if data[64] == 0 else Board.BLACK)
+        board.cost = int.from_bytes(data[65:67], "big")
+        return board
 
     def copy(self):
         return deepcopy(self)
@@ -242,13 +609,16 @@ class Board:
         board.colour = self.colour
         board.opponent_colour = self.opponent_colour
         board.cost = self.cost
+        board.key = self.key
+        board.index_cells()
+        board.index_partitions()
         board.bottom_row = self.bottom_row
         board.second_bottom_row = self.second_bottom_row
         board.half_range = self.half_range
         return board
 
     def __hash__(self):
-        return hash(str(self.board))
+        return self.key
 
     def __repr__(self):
         return str(sorted(self.board.items(), key=lambda t: t[1]))
@@ -257,4 +627,4 @@ class Board:
         return False
 
     def __eq__(self, other):
-        return isinstance(other, Board) and self.board == other.board
+        return isinstance(other, Board) and self.key == other.key and self.board == other.board
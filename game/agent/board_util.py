@@ -5,6 +5,50 @@ load board utility data, evaluate board
 """
 
 
+def _build_adjacent_data():
+    """
+    pre-calculate the adjacent cells of every cell, the same data as board-util-data.json
+    Returns:
+        tuple of cardinal and surround dict with position tuple keys
+    """
+    cardinal = dict()
+    surround = dict()
+
+    cardinal_dirs = [(0, 1), (0, -1), (1, 0), (-1, 0)]
+    surround_dirs = [(1, -1), (1, 0), (1, 1), (0, 1), (0, -1), (-1, -1), (-1, 0), (-1, 1)]
+
+    for x in range(8):
+        for y in range(8):
+            cardinal[(x, y)] = dict()
+            accumulation = []
+            for step in range(1, 13):
+                for direction in cardinal_dirs:
+                    next_x, next_y = x + direction[0] * step, y + direction[1] * step
+                    if -1 < next_x < 8 and -1 < next_y < 8:
+                        accumulation.append((next_x, next_y))
+                cardinal[(x, y)][step] = accumulation.copy()
+
+            surround[(x, y)] = [(x + dx, y + dy) for dx, dy in surround_dirs if -1 < x + dx < 8 and -1 < y + dy < 8]
+    return cardinal, surround
+
+
+def _build_distance_data():
+    """
+    pre-calculate the minimum steps of a stack between every two squares, see BoardUtil.board_distance
+    Returns:
+        bytes, the steps of a stack of n tokens from square i to square j (i = y * 8 + x)
+        are at index (n * 64 + i) * 64 + j, n is 1 to 12, n = 0 is unused
+    """
+    # steps[n][d]: steps of a stack of n tokens along d squares of a row or a column
+    steps = [[0] * 8] + [[-(-d // n) for d in range(8)] for n in range(1, 13)]
+    data = bytearray()
+    for n_steps in steps:
+        for i in range(64):
+            x, y = i % 8, i // 8
+            data += bytes([n_steps[abs(x - j % 8)] + n_steps[abs(y - j // 8)] for j in range(64)])
+    return bytes(data)
+
+
 class BoardUtil:
     """
     static utility methods or objects for Board
@@ -12,24 +56,62 @@ class BoardUtil:
     # stack score table
     MAX_STACK_SCORE = 3
     stack_score_table = {1: 0, 2: 0.4, 3: 1, 4: 1.8, 5: 2.5, 6: 3}
+    # the same table in tenths, integer sums don't depend on the order of the cells
+    MAX_STACK_SCORE_TENTHS = 30
+    stack_score_tenths = {1: 0, 2: 4, 3: 10, 4: 18, 5: 25, 6: 30}
 
-    cardinal = dict()
-    surround = dict()
+    # adjacent cell data of every cell, built at import time,
+    # initialize() replaces it with the data of a board-util-data.json
+    cardinal, surround = _build_adjacent_data()
+
+    # stack distance table built on first use, see get_distance_data() and get_distance_array()
+    distance_data = None
+    distance_array = None
 
     @staticmethod
     def initialize(data):
         """
-        parse board-util-data.json which contains the adjacent cell data of every cell
+        parse board-util-data.json which contains the adjacent cell data of every cell,
+        the same data is already built at import time so this is optional
         Args:
             data: json data from board-util-data.json
         """
+        cardinal = dict()
         for pos, steps in data["cardinal"].items():
-            BoardUtil.cardinal[eval(pos)] = dict()
-            for step, cells in steps.items():
-                BoardUtil.cardinal[eval(pos)][int(step)] = [eval(cell) for cell in cells]
+            cardinal[BoardUtil.parse_pos(pos)] = {int(step): [BoardUtil.parse_pos(cell) for cell in cells]
+                                                  for step, cells in steps.items()}
+
+        BoardUtil.cardinal = cardinal
+        BoardUtil.surround = {BoardUtil.parse_pos(pos): [BoardUtil.parse_pos(cell) for cell in cells]
+                              for pos, cells in data["surround"].items()}
+
+    @staticmethod
+    def parse_pos(text):
+        """
+        parse a position string of board-util-data.json
+        Args:
+            text: position string, e.g. "(1, 2)"
+        Returns:
+            position tuple
+        """
+        x, y = text.strip("()").split(",")
+        return int(x), int(y)
 
-        for pos, cells in data["surround"].items():
-            BoardUtil.surround[eval(pos)] = [eval(cell) for cell in cells]
+    @staticmethod
+    def analyse(board):
+        """
+        the analysis of the current state of a board, it is attached to the board
+        and computed again only after the board has changed
+        Args:
+            board: board object
+        Returns:
+            BoardAnalysis object
+        """
+        analysis = board.analysis
+        if analysis is None or analysis.key != board.key:
+            analysis = BoardAnalysis(board)
+            board.analysis = analysis
+        return analysis
 
     @staticmethod
     def valid_pos(x, y):
@@ -81,12 +163,14 @@ class BoardUtil:
             score
         """
         colour = pre_board.colour
-        pre_own_token_num, _ = pre_board.own_token_cell_num()
-        pre_opponent_token_num, _ = pre_board.opponent_token_cell_num()
-        mid_own_token_num, _ = mid_board.own_token_cell_num()
-        mid_opponent_token_num, _ = mid_board.opponent_token_cell_num()
-        post_own_token_num, _ = post_board.own_token_cell_num()
-        post_opponent_token_num, _ = post_board.opponent_token_cell_num()
+        opponent_colour = pre_board.opponent_colour
+        pre, mid, post = BoardUtil.analyse(pre_board), BoardUtil.analyse(mid_board), BoardUtil.analyse(post_board)
+        pre_own_token_num, _ = pre.get_token_cell_num(colour)
+        pre_opponent_token_num, _ = pre.get_token_cell_num(opponent_colour)
+        mid_own_token_num, _ = mid.get_token_cell_num(colour)
+        mid_opponent_token_num, _ = mid.get_token_cell_num(opponent_colour)
+        post_own_token_num, _ = post.get_token_cell_num(colour)
+        post_opponent_token_num, _ = post.get_token_cell_num(opponent_colour)
 
         kill_token, dead_token, bonus = 0, 0, 0
         # opponent tokens killed by you
@@ -129,9 +213,10 @@ class BoardUtil:
             score
         """
         score = 0
-        own_token_num, own_cell_num = board.own_token_cell_num()
+        analysis = BoardUtil.analyse(board)
+        own_token_num, own_cell_num = analysis.get_token_cell_num(board.colour)
 
-        for cell in board.get_own_cells():
+        for cell in analysis.get_cells(board.colour):
             # get stack score from score table
             score += BoardUtil.stack_score_table.get(cell.n, BoardUtil.MAX_STACK_SCORE)
 
@@ -152,10 +237,10 @@ class BoardUtil:
         Returns:
             float, average stack score value
         """
-        cells = board.get_own_cells()
-        if board.get_own_cells():
-            return \
-                sum([BoardUtil.stack_score_table.get(cell.n, BoardUtil.MAX_STACK_SCORE) for cell in cells]) / len(cells)
+        cells = BoardUtil.analyse(board).get_cells(board.colour)
+        if cells:
+            return sum([BoardUtil.stack_score_tenths.get(cell.n, BoardUtil.MAX_STACK_SCORE_TENTHS)
+                        for cell in cells]) / (10 * len(cells))
         else:
             return 0
 
@@ -170,7 +255,8 @@ class BoardUtil:
         """
         # only in early stage
         if board.cost < 13:
-            return sum([cell.n for cell in board.get_own_cells() if cell.y != board.bottom_row])
+            cells = BoardUtil.analyse(board).get_cells(board.colour)
+            return sum([cell.n for cell in cells if cell.y != board.bottom_row])
         return 0
 
     @staticmethod
@@ -193,7 +279,7 @@ class BoardUtil:
         Returns:
             marginal token number
         """
-        return sum([c.n for c in board.board.values() if c.colour == board.colour and BoardUtil.is_marginal(c)])
+        return sum([c.n for c in BoardUtil.analyse(board).get_cells(board.colour) if BoardUtil.is_marginal(c)])
 
     @staticmethod
     def is_cornered(cell):
@@ -215,7 +301,7 @@ class BoardUtil:
         Returns:
             cornered token number
         """
-        return sum([c.n for c in board.board.values() if c.colour == board.colour and BoardUtil.is_cornered(c)])
+        return sum([c.n for c in BoardUtil.analyse(board).get_cells(board.colour) if BoardUtil.is_cornered(c)])
 
     @staticmethod
     def partitions_and_vulnerable_spots(board, is_own):
@@ -243,66 +329,10 @@ class BoardUtil:
         Returns:
             a tuple of
             list of partition items that contain at least one own(or opponent) cell,
-            dictionary of vulnerable spots
+            dictionary of vulnerable spots, both are shared by the board analysis and must not be modified
         """
-        cells = board.get_own_cells() if is_own else board.get_opponent_cells()
-        opponent_cells = board.get_opponent_cells() if is_own else board.get_own_cells()
-        own_colour = board.colour if is_own else board.opponent_colour
-        opponent_colour = board.opponent_colour if is_own else board.colour
-
-        visited = set()
-        partitions = []
-        vul_spots = dict()
-
-        def recursive_search(pos, connected_list):
-            """
-            find all the cells that belong to a partition
-            """
-            current_cell = board.board[pos]
-            connected_list.append(current_cell)
-            visited.add(pos)
-
-            for next_pos in BoardUtil.surround[pos]:
-                if next_pos not in board.board:
-                    # a vulnerable spot
-                    if next_pos in vul_spots:
-                        vul_spots[next_pos]["value"] += 1
-                        vul_spots[next_pos][current_cell.colour] += 1
-                    else:
-                        spot = dict()
-                        spot["value"] = 1
-                        spot["reaches"] = []
-                        if current_cell.colour == "white":
-                            spot["white"] = 1
-                            spot["black"] = 0
-                        else:
-                            spot["white"] = 0
-                            spot["black"] = 1
-                        vul_spots[next_pos] = spot
-                elif next_pos not in visited:
-                    # cell in partition
-                    recursive_search(next_pos, connected_list)
-
-        # find partitions
-        for cell in cells:
-            if cell.pos not in visited:
-                partition = dict()
-                partition_cells = []
-                recursive_search(cell.pos, partition_cells)
-                partition["cells"] = partition_cells
-                partition["black"] = sum([cell.n for cell in partition_cells if cell.colour == "black"])
-                partition["white"] = sum([cell.n for cell in partition_cells if cell.colour == "white"])
-                partitions.append(partition)
-
-        # find reachable opponent cells for partitions containing more own tokens
-        for partition in partitions:
-            if partition[own_colour] > partition[opponent_colour]:
-                for vul_pos, spot in vul_spots.items():
-                    for oc in opponent_cells:
-                        if oc not in partition and vul_pos in BoardUtil.cardinal[oc.pos][oc.n]:
-                            spot["reaches"].append(oc.pos)
-
-        return partitions, vul_spots
+        colour = board.colour if is_own else board.opponent_colour
+        return BoardUtil.analyse(board).get_partitions_and_vulnerable_spots(colour)
 
     @staticmethod
     def max_partition_token_diff(partitions, colour):
@@ -383,6 +413,66 @@ class BoardUtil:
             return (opponent_vulnerable_score - own_vulnerable_value) / 2
         return 0
 
+    @staticmethod
+    def winning_boom(board):
+        """
+        find a boom removing every opponent token and keeping some own tokens
+        Args:
+            board: board object
+        Returns:
+            BOOM action tuple, None if there is none
+        """
+        own_token_num = board.own_token_cell_num()[0]
+        opponent_token_num = board.opponent_token_cell_num()[0]
+        for partition in board.get_partitions():
+            if partition[board.opponent_colour] == opponent_token_num and 0 < partition[board.colour] < own_token_num:
+                for pos, cell in partition["cells"].items():
+                    if cell.colour == board.colour:
+                        return "BOOM", pos
+        return None
+
+    @staticmethod
+    def is_threatened(board):
+        """
+        whether the opponent can remove every own token with a single boom,
+        i.e. a partition contains all own tokens and some opponent tokens
+        Args:
+            board: board object
+        Returns:
+            bool
+        """
+        own_token_num = board.own_token_cell_num()[0]
+        if not own_token_num:
+            return True
+        for partition in board.get_partitions():
+            if partition[board.colour] == own_token_num and partition[board.opponent_colour]:
+                return True
+        return False
+
+    @staticmethod
+    def is_dominated_split(board, action):
+        """
+        dominance rules of the optional move pruning, a partial split (moving fewer tokens
+        than the stack has) is dominated when it
+            1. moves the tokens backwards, towards the own bottom row, or
+            2. moves the tokens onto an empty edge square
+        booms and full-stack moves are never dominated
+        Args:
+            board: board object
+            action: valid action tuple
+        Returns:
+            bool
+        """
+        if action[0] == "BOOM":
+            return False
+        n, pos, next_pos = action[1], action[2], action[3]
+        if n == board.board[pos].n:
+            return False
+        if abs(next_pos[1] - board.bottom_row) < abs(pos[1] - board.bottom_row):
+            return True
+        x, y = next_pos
+        return (x == 0 or y == 0 or x == 7 or y == 7) and next_pos not in board.board
+
     @staticmethod
     def opponent_leftover_chasing(board, spots):
         """
@@ -394,8 +484,9 @@ class BoardUtil:
         Returns:
             chasing score
         """
-        own_token_num, own_cell_num = board.own_token_cell_num()
-        opponent_token_num, opponent_cell_num = board.opponent_token_cell_num()
+        analysis = BoardUtil.analyse(board)
+        own_token_num, own_cell_num = analysis.get_token_cell_num(board.colour)
+        opponent_token_num, opponent_cell_num = analysis.get_token_cell_num(board.opponent_colour)
         token_diff = own_token_num - opponent_token_num
 
         # chase when we have advantage
@@ -405,20 +496,27 @@ class BoardUtil:
                 if spot["reaches"]:
                     return 0
 
-            max_score = 0
-            for cell in board.get_own_cells():
-                for vul_pos in spots.keys():
-                    dist = BoardUtil.board_distance(cell, vul_pos)
-                    if dist == 0 and cell.n > 1:
-                        score = 3 - cell.n / 3
-                    else:
-                        score = 3 / dist
-
-                    if score > max_score:
-                        max_score = score
-            return max_score
+            return BoardUtil.chasing_score(analysis.get_cells(board.colour), spots)
         return 0
 
+    @staticmethod
+    def chasing_score(cells, spots):
+        """
+        3 / the minimum distance between the cells and the vulnerable spots, a single
+        vectorized min over the cells and spots of the distance table,
+        the spots are empty squares so the distance is at least 1
+        Args:
+            cells: list of Cell objects
+            spots: iterable of vulnerable spot positions
+        Returns:
+            chasing score, 0 if there is no cell or spot
+        """
+        spot_indices = [y * 8 + x for x, y in spots]
+        if not cells or not spot_indices:
+            return 0
+        distances = BoardUtil.get_distance_array()[[cell.n for cell in cells], [cell.y * 8 + cell.x for cell in cells]]
+        return 3 / int(distances[:, spot_indices].min())
+
     @staticmethod
     def board_distance(cell, goal):
         """
@@ -429,14 +527,148 @@ class BoardUtil:
         Returns:
             number of steps
         """
-        goal_x, goal_y = goal[0], goal[1]
-        x_dist = abs(cell.x - goal_x)
-        y_dist = abs(cell.y - goal_y)
-        if cell.n == 1:
-            return x_dist + y_dist
-        else:
-            x_remain = 1 if x_dist % cell.n else 0
-            y_remain = 1 if y_dist % cell.n else 0
-            x_steps = x_dist // cell.n + x_remain
-            y_steps = y_dist // cell.n + y_remain
-            return x_steps + y_steps
+        return BoardUtil.get_distance_data()[((cell.n * 64 + cell.y * 8 + cell.x) << 6) + goal[1] * 8 + goal[0]]
+
+    @staticmethod
+    def get_distance_data():
+        """
+        Returns:
+            bytes of the stack distance table, see _build_distance_data()
+        """
+        if BoardUtil.distance_data is None:
+            BoardUtil.distance_data = _build_distance_data()
+        return BoardUtil.distance_data
+
+    @staticmethod
+    def get_distance_array():
+        """
+        Returns:
+            numpy view of the stack distance table, shape (13, 64, 64): stack height, from square, to square
+        """
+        import numpy as np
+
+        if BoardUtil.distance_array is None:
+            BoardUtil.distance_array = np.frombuffer(BoardUtil.get_distance_data(), dtype=np.uint8).reshape(13, 64, 64)
+        return BoardUtil.distance_array
+
+
+class BoardAnalysis:
+    """
+    positional analysis of a board state shared by the features and rewards,
+    every part is computed on first use, at most once per board state,
+    get it with BoardUtil.analyse(board) so that it matches the current state
+    """
+    def __init__(self, board):
+        """
+        Args:
+            board: board object, must not change while the analysis is used
+        """
+        self.board = board
+        self.key = board.key
+        # key: colour, computed on first use
+        self.cells = dict()
+        self.token_cell_num = dict()
+        self.attackers = dict()
+        self.partitions_and_vul_spots = dict()
+
+    def get_cells(self, colour):
+        """
+        Returns:
+            list of cells of a colour, must not be modified
+        """
+        if colour not in self.cells:
+            self.cells[colour] = \
+                self.board.get_white_cells() if colour == "white" else self.board.get_black_cells()
+        return self.cells[colour]
+
+    def get_token_cell_num(self, colour):
+        """
+        Returns:
+            tuple (token_num, cell_num) of a colour
+        """
+        if colour not in self.token_cell_num:
+            self.token_cell_num[colour] = \
+                self.board.white_token_cell_num() if colour == "white" else self.board.black_token_cell_num()
+        return self.token_cell_num[colour]
+
+    def get_attackers(self, colour):
+        """
+        reverse reachability of the cells of a colour, a stack of n tokens at (x, y) reaches
+        the squares of BoardUtil.cardinal[(x, y)][n], which is symmetric: the stacks that reach
+        a square are on its row and column within their height
+        Returns:
+            dict, key: (x, y) value: list of positions of the cells that can move to (x, y) in cell order,
+            must not be modified
+        """
+        if colour not in self.attackers:
+            attackers = dict()
+            for cell in self.get_cells(colour):
+                for pos in BoardUtil.cardinal[cell.pos][cell.n]:
+                    if pos in attackers:
+                        attackers[pos].append(cell.pos)
+                    else:
+                        attackers[pos] = [cell.pos]
+            self.attackers[colour] = attackers
+        return self.attackers[colour]
+
+    def get_partitions_and_vulnerable_spots(self, colour):
+        """
+        partitions containing tokens of a colour and their vulnerable spots with the
+        reaches of the other colour, see BoardUtil.partitions_and_vulnerable_spots
+        """
+        if colour not in self.partitions_and_vul_spots:
+            self.partitions_and_vul_spots[colour] = self.find_partitions_and_vulnerable_spots(colour)
+        return self.partitions_and_vul_spots[colour]
+
+    def find_partitions_and_vulnerable_spots(self, own_colour):
+        """
+        Args:
+            own_colour: colour of the partitions
+        Returns:
+            tuple of partition list and vulnerable spots
+        """
+        board = self.board
+        opponent_colour = "black" if own_colour == "white" else "white"
+
+        partitions = []
+        vul_spots = dict()
+
+        # partitions are maintained by the board, pick the ones containing own(or opponent) tokens
+        for board_partition in board.get_partitions():
+            if not board_partition[own_colour]:
+                continue
+
+            partition = dict()
+            partition["cells"] = list(board_partition["cells"].values())
+            partition["black"] = board_partition["black"]
+            partition["white"] = board_partition["white"]
+            partitions.append(partition)
+
+            for cell in partition["cells"]:
+                for next_pos in BoardUtil.surround[cell.pos]:
+                    if next_pos not in board.board:
+                        # a vulnerable spot
+                        if next_pos in vul_spots:
+                            vul_spots[next_pos]["value"] += 1
+                            vul_spots[next_pos][cell.colour] += 1
+                        else:
+                            spot = dict()
+                            spot["value"] = 1
+                            spot["reaches"] = []
+                            if cell.colour == "white":
+                                spot["white"] = 1
+                                spot["black"] = 0
+                            else:
+                                spot["white"] = 0
+                                spot["black"] = 1
+                            vul_spots[next_pos] = spot
+
+        # find reachable opponent cells, they are listed once for every partition containing more own tokens
+        majority_num = len([p for p in partitions if p[own_colour] > p[opponent_colour]])
+        if majority_num:
+            attackers = self.get_attackers(opponent_colour)
+            for vul_pos, spot in vul_spots.items():
+                if vul_pos in attackers:
+                    spot["reaches"] = attackers[vul_pos] * majority_num
+
+        return partitions, vul_spots
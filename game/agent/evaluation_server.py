@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+evaluation service shared by the players of many concurrent games, the players submit
+the board bytes (see Board.to_bytes) and the action ids of a decision (see agent.action_table),
+the requests arriving within a short batching window are scored in a single numpy batch
+with one copy of the weights of each colour, and the chosen action is returned
+
+the server runs in a thread of the players' process (LocalEvaluator), or in its own
+process serving the players over pipes (PipeEvaluator, see start_server_process)
+"""
+
+import json
+import os
+import random
+from time import perf_counter
+from agent.board import Board
+from agent.action_table import ACTIONS, ACTION_IDS
+from agent.feature_state import FeatureState
+from agent.q_learning_table import FEATURE_NAMES
+
+
+def get_weight_files():
+    """
+    Returns:
+        dict of the weight files of the agent, key: colour
+    """
+    dir_path = os.path.dirname(os.path.realpath(__file__))
+    return {Board.WHITE: os.path.join(dir_path, "white-weights.json"),
+            Board.BLACK: os.path.join(dir_path, "black-weights.json")}
+
+
+class EvaluationServer:
+    """
+    batches the requests of many players, a request is a tuple (data, action_ids, partitions),
+    data: bytes of the board, action_ids: list of valid action ids,
+    partitions: whether to compute the partition features, see FeatureState
+    """
+    def __init__(self, values_files=None, board_class=Board, window=0.001, max_batch=64):
+        """
+        Args:
+            values_files: dict of the weight files, key: colour, the agent's files by default
+            board_class: board engine decoding the requests, Board or BitBoard
+            window: seconds to wait for more requests after the first one of a batch
+            max_batch: maximum number of requests of a batch
+        """
+        import numpy as np
+
+        self.board_class = board_class
+        self.window = window
+        self.max_batch = max_batch
+        # weight vectors in the order of FEATURE_NAMES, key: colour
+        self.weights = dict()
+        for colour, values_file in (values_files or get_weight_files()).items():
+            with open(values_file, 'r') as file:
+                weights = json.load(file)
+            self.weights[colour] = np.array([float(weights[name]) for name in FEATURE_NAMES])
+
+        # in-process mode, see start_thread()
+        self.queue = None
+        self.thread = None
+        # number of evaluated batches and requests
+        self.batch_num = 0
+        self.request_num = 0
+
+    def evaluate(self, requests):
+        """
+        score the actions of a batch of requests with one matrix product per colour
+        Args:
+            requests: list of request tuples
+        Returns:
+            list of the chosen action ids in the order of requests, an action with the
+            max Q value chosen randomly among the equal ones
+        """
+        import numpy as np
+
+        # rows of the feature matrix of each colour and the row range of each request
+        rows = {Board.WHITE: [], Board.BLACK: []}
+        bounds = []
+        for data, action_ids, partitions in requests:
+            board = self.board_class.from_bytes(data)
+            state = FeatureState(board, partitions=partitions)
+            colour_rows = rows[board.colour]
+            start = len(colour_rows)
+            colour_rows.extend([state.get_feature_vector(ACTIONS[i]) for i in action_ids])
+            bounds.append((board.colour, start, len(colour_rows)))
+
+        q_values = {colour: np.array(colour_rows) @ self.weights[colour]
+                    for colour, colour_rows in rows.items() if colour_rows}
+
+        chosen = []
+        for (data, action_ids, _), (colour, start, end) in zip(requests, bounds):
+            values = q_values[colour][start:end]
+            max_indices = np.flatnonzero(values == values.max())
+            chosen.append(action_ids[max_indices[random.randint(0, len(max_indices) - 1)]])
+
+        self.batch_num += 1
+        self.request_num += len(requests)
+        return chosen
+
+    def start_thread(self):
+        """
+        serve the LocalEvaluator clients of this process from a daemon thread
+        """
+        import queue
+        import threading
+
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.run_thread, daemon=True)
+        self.thread.start()
+
+    def run_thread(self):
+        """
+        batch loop of the in-process mode, a queued item is a tuple (request, future),
+        None stops the loop
+        """
+        import queue
+
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            items = [item]
+            deadline = perf_counter() + self.window
+            while len(items) < self.max_batch:
+                timeout = deadline - perf_counter()
+                try:
+                    item = self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self.queue.put(None)
+                    break
+                items.append(item)
+
+            try:
+                chosen = self.evaluate([request for request, _ in items])
+            except Exception as error:
+                for _, future in items:
+                    future.set_exception(error)
+            else:
+                for (_, future), action_id in zip(items, chosen):
+                    future.set_result(action_id)
+
+    def submit(self, request):
+        """
+        queue a request in the in-process mode
+        Returns:
+            concurrent.futures.Future of the chosen action id
+        """
+        from concurrent.futures import Future
+
+        future = Future()
+        self.queue.put((request, future))
+        return future
+
+    def stop_thread(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def serve(self, connections):
+        """
+        batch loop of the process mode, a request is received from every connection
+        that has one ready, within the batching window, the loop ends when every
+        connection is closed
+        Args:
+            connections: list of multiprocessing connections of the PipeEvaluator clients
+        """
+        from multiprocessing.connection import wait
+
+        connections = list(connections)
+        while connections:
+            pending = []
+            ready = wait(connections)
+            deadline = perf_counter() + self.window
+            while ready:
+                for connection in ready:
+                    try:
+                        pending.append((connection, connection.recv()))
+                    except EOFError:
+                        connections.remove(connection)
+                # the clients wait for their answer, at most one request is pending for each
+                waiting = [connection for connection in connections
+                           if connection not in [pending_connection for pending_connection, _ in pending]]
+                timeout = deadline - perf_counter()
+                if timeout <= 0 or not waiting or len(pending) >= self.max_batch:
+                    break
+                ready = wait(waiting, timeout)
+
+            if pending:
+                chosen = self.evaluate([request for _, request in pending])
+                for (connection, _), action_id in zip(pending, chosen):
+                    connection.send(action_id)
+
+
+def _serve_process(values_files, board_class, window, max_batch, connections, client_connections):
+    # the client ends inherited by a forked process would keep the pipes open
+    for connection in client_connections:
+        connection.close()
+    EvaluationServer(values_files, board_class, window, max_batch).serve(connections)
+
+
+def start_server_process(client_num, values_files=None, board_class=Board, window=0.001, max_batch=64):
+    """
+    start an EvaluationServer in its own process
+    Args:
+        client_num: number of PipeEvaluator clients, one for each player
+        values_files, board_class, window, max_batch: see EvaluationServer
+    Returns:
+        tuple of the server process and the list of clients
+    """
+    from multiprocessing import Pipe, Process
+
+    pipes = [Pipe() for _ in range(client_num)]
+    process = Process(target=_serve_process, daemon=True,
+                      args=(values_files, board_class, window, max_batch,
+                            [server for server, _ in pipes], [client for _, client in pipes]))
+    process.start()
+    for server, _ in pipes:
+        server.close()
+    return process, [PipeEvaluator(client) for _, client in pipes]
+
+
+class LocalEvaluator:
+    """
+    client of an EvaluationServer running in a thread of this process, it can be
+    passed to ApproximateQLearning as the evaluator, the server's weights are used
+    """
+    def __init__(self, server):
+        self.server = server
+
+    @staticmethod
+    def is_worth(actions):
+        return True
+
+    def choose_action(self, board, actions, weights=None, partitions=True):
+        """
+        Args:
+            board: Board object
+            actions: list of valid action tuples
+            weights: unused, the server keeps the weights
+            partitions: whether to compute the partition features, see FeatureState
+        Returns:
+            the action chosen by the server
+        """
+        request = (board.to_bytes(), [ACTION_IDS[action] for action in actions], partitions)
+        return ACTIONS[self.server.submit(request).result()]
+
+    def close(self):
+        pass
+
+
+class PipeEvaluator:
+    """
+    client of an EvaluationServer running in another process, see start_server_process,
+    it can be passed to ApproximateQLearning as the evaluator, the server's weights are used
+    """
+    def __init__(self, connection):
+        self.connection = connection
+
+    @staticmethod
+    def is_worth(actions):
+        return True
+
+    def choose_action(self, board, actions, weights=None, partitions=True):
+        """
+        see LocalEvaluator.choose_action
+        """
+        self.connection.send((board.to_bytes(), [ACTION_IDS[action] for action in actions], partitions))
+        return ACTIONS[self.connection.recv()]
+
+    def close(self):
+        """
+        detach from the server, the server stops when every client is closed
+        """
+        self.connection.close()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+declarative registry of the board features and the intermediate values they depend on,
+every computation is timed and counted
+"""
+
+from time import perf_counter
+
+
+class FeatureRegistry:
+    """
+    a node is a feature or an intermediate value shared by features, it is computed by
+    function(board, values) where values is a dict containing the values of its dependencies,
+    a node is computed at most once per evaluation and only if a requested feature needs it
+    """
+    def __init__(self):
+        # key: node name, value: {"function", "dependencies", "cheap", "count", "time"}
+        self.nodes = dict()
+        # evaluation order of the requested names, key: tuple of names
+        self.orders = dict()
+        # timings recorded outside of the nodes, key: name, value: {"count", "time"}
+        self.records = dict()
+
+    def register(self, name, dependencies=(), cheap=True):
+        """
+        decorator registering a node
+        Args:
+            name: node name
+            dependencies: names of the registered nodes the function reads from values
+            cheap: whether the function is cheap, a node is only cheap if all its dependencies are
+        Returns:
+            decorator returning the function unchanged
+        """
+        def decorator(function):
+            for dependency in dependencies:
+                if dependency not in self.nodes:
+                    raise ValueError("{} depends on unregistered {}".format(name, dependency))
+            self.nodes[name] = {"function": function, "dependencies": tuple(dependencies), "cheap": cheap,
+                                "count": 0, "time": 0.0}
+            self.orders.clear()
+            return function
+        return decorator
+
+    def is_cheap(self, name):
+        """
+        whether a node and all nodes it depends on are cheap
+        """
+        node = self.nodes[name]
+        return node["cheap"] and all([self.is_cheap(dependency) for dependency in node["dependencies"]])
+
+    def get_cheap_names(self, names):
+        """
+        Args:
+            names: node names
+        Returns:
+            tuple of the cheap names in the same order
+        """
+        return tuple([name for name in names if self.is_cheap(name)])
+
+    def get_order(self, names):
+        """
+        Args:
+            names: tuple of node names
+        Returns:
+            list of the names and their dependencies, every node after its dependencies
+        """
+        if names not in self.orders:
+            order = []
+
+            def visit(name):
+                if name not in order:
+                    for dependency in self.nodes[name]["dependencies"]:
+                        visit(dependency)
+                    order.append(name)
+
+            for name in names:
+                visit(name)
+            self.orders[names] = order
+        return self.orders[names]
+
+    def evaluate(self, board, names):
+        """
+        compute nodes of a board
+        Args:
+            board: board object
+            names: tuple of node names
+        Returns:
+            dict of node values, containing the names and their dependencies
+        """
+        values = dict()
+        for name in self.get_order(names):
+            node = self.nodes[name]
+            start = perf_counter()
+            values[name] = node["function"](board, values)
+            node["time"] += perf_counter() - start
+            node["count"] += 1
+        return values
+
+    def record(self, name, elapsed, count=1):
+        """
+        add the time of a computation done outside of the nodes, e.g. incremental evaluation
+        """
+        record = self.records.setdefault(name, {"count": 0, "time": 0.0})
+        record["count"] += count
+        record["time"] += elapsed
+
+    def get_stats(self):
+        """
+        Returns:
+            dict, key: node or record name, value: {"count", "time", "mean"} with times in seconds
+        """
+        stats = dict()
+        for name, item in list(self.nodes.items()) + list(self.records.items()):
+            stats[name] = {"count": item["count"], "time": item["time"],
+                           "mean": item["time"] / item["count"] if item["count"] else 0}
+        return stats
+
+    def reset_stats(self):
+        for node in self.nodes.values():
+            node["count"] = 0
+            node["time"] = 0.0
+        self.records.clear()
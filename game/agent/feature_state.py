@@ -0,0 +1,336 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+incremental feature evaluation, the feature data of a board is computed once and
+the features of the board after each action are derived from the squares and
+partitions the action changes
+"""
+
+from agent.board import Board, Cell
+from agent.board_util import BoardUtil
+
+# probability for each max-vulnerability-value to successfully kill opponent tokens, see BoardUtil
+PROBABILITY_TABLE = {0: 0, 1: 0.3, 2: 0.7, 3: 0.8, 4: 0.9}
+
+
+class FeatureState:
+    """
+    feature data of a board, get_feature_vector(action) is equal to
+    ApproximateQLearning.get_board_feature_vector of the board after the action
+    without applying it
+
+    a partition is stored as a tuple (cells, white_token_num, black_token_num, spots),
+    cells: dict of key: (x, y) value: Cell()
+    spots: the vulnerable spots of the partition, key: (x, y) value: (white_value, black_value),
+    the value of a spot is the number of adjacent partition cells of each colour,
+    the vulnerable spots of a side are the sum of the spots of its partitions
+    """
+    def __init__(self, board, partitions=True):
+        """
+        Args:
+            board: Board or BitBoard object
+            partitions: whether to compute the partition and vulnerability features,
+                they are 0 otherwise
+        """
+        self.board = board
+        self.with_partitions = partitions
+        self.colour = board.colour
+        self.opponent_colour = board.opponent_colour
+        self.cost = board.cost
+        self.bottom_row = board.bottom_row
+        self.cells = dict(board.board)
+
+        # key: (x, y) value: index of the partition in self.partitions
+        self.partition_of = dict()
+        self.partitions = []
+        # vulnerable spots of the partitions containing tokens of each colour
+        self.spots = {Board.WHITE: dict(), Board.BLACK: dict()}
+        if partitions:
+            for partition in board.get_partitions():
+                for pos in partition["cells"]:
+                    self.partition_of[pos] = len(self.partitions)
+                self.partitions.append(self.new_partition(dict(partition["cells"])))
+
+            for partition in self.partitions:
+                for colour, index in ((Board.WHITE, 1), (Board.BLACK, 2)):
+                    if partition[index]:
+                        self.add_spots(self.spots[colour], partition[3], 1)
+
+        # number of cells of each colour that can move to a square, key: (x, y) value: int
+        self.reach = {Board.WHITE: dict(), Board.BLACK: dict()}
+        self.token_num = {Board.WHITE: 0, Board.BLACK: 0}
+        self.cell_num = {Board.WHITE: 0, Board.BLACK: 0}
+        for cell in self.cells.values():
+            self.token_num[cell.colour] += cell.n
+            self.cell_num[cell.colour] += 1
+            if partitions:
+                self.add_reach(self.reach[cell.colour], cell.pos, cell.n, 1)
+
+        # own token sums: marginal, cornered, not in bottom row, stack score in tenths
+        self.own_sums = [0, 0, 0, 0]
+        for cell in board.get_own_cells():
+            self.add_own_sums(self.own_sums, cell.pos, cell.n, 1)
+
+    @staticmethod
+    def new_partition(cells):
+        """
+        Args:
+            cells: dict of connected cells, key: (x, y) value: Cell()
+        Returns:
+            partition tuple, see FeatureState
+        """
+        token_num = {Board.WHITE: 0, Board.BLACK: 0}
+        spots = dict()
+        for pos, cell in cells.items():
+            token_num[cell.colour] += cell.n
+            for next_pos in BoardUtil.surround[pos]:
+                # the not-empty neighbours of a partition cell are in the same partition
+                if next_pos not in cells:
+                    white, black = spots.get(next_pos, (0, 0))
+                    spots[next_pos] = (white + 1, black) if cell.colour == Board.WHITE else (white, black + 1)
+        return cells, token_num[Board.WHITE], token_num[Board.BLACK], spots
+
+    @staticmethod
+    def add_spots(spots, partition_spots, sign):
+        """
+        add (sign = 1) or subtract (sign = -1) the spots of a partition to the spots of a side
+        """
+        for pos, (white, black) in partition_spots.items():
+            total_white, total_black = spots.get(pos, (0, 0))
+            total_white += sign * white
+            total_black += sign * black
+            if total_white or total_black:
+                spots[pos] = (total_white, total_black)
+            else:
+                del spots[pos]
+
+    def add_own_sums(self, sums, pos, n, sign):
+        """
+        add (sign = 1) or subtract (sign = -1) an own stack of n tokens at pos to the own token sums
+        """
+        x, y = pos
+        if x == 0 or y == 0 or x == 7 or y == 7:
+            sums[0] += sign * n
+            if (x == 0 or x == 7) and (y == 0 or y == 7):
+                sums[1] += sign * n
+        if y != self.bottom_row:
+            sums[2] += sign * n
+        sums[3] += sign * BoardUtil.stack_score_tenths.get(n, BoardUtil.MAX_STACK_SCORE_TENTHS)
+
+    @staticmethod
+    def add_reach(reach, pos, n, sign):
+        for next_pos in BoardUtil.cardinal[pos][n]:
+            reach[next_pos] = reach.get(next_pos, 0) + sign
+
+    def get_feature_vector(self, action):
+        """
+        features of the board after taking an action
+        Args:
+            action: action tuple
+        Returns:
+            list of feature values in the order of FEATURE_NAMES in agent.q_learning_table
+        """
+        if action[0] == "BOOM":
+            return self.boom_feature_vector(action[1])
+        return self.move_feature_vector(action[1], action[2], action[3])
+
+    def boom_feature_vector(self, pos):
+        """
+        a boom removes the whole partition of pos, the other partitions are not adjacent to it
+        """
+        if not self.with_partitions:
+            cells = {cell.pos: cell for cell in self.board.get_connected_cells(*pos)}
+            return self.feature_vector(None, None, None, *self.boom_counts(cells))
+
+        removed = self.partition_of[pos]
+        cells, white, black, partition_spots = self.partitions[removed]
+        token_num, cell_num, own_sums, own_cells = self.boom_counts(cells)
+
+        reach = {Board.WHITE: dict(), Board.BLACK: dict()}
+        for cell in cells.values():
+            self.add_reach(reach[cell.colour], cell.pos, cell.n, -1)
+
+        spots = {Board.WHITE: self.spots[Board.WHITE].copy(), Board.BLACK: self.spots[Board.BLACK].copy()}
+        for colour, num in ((Board.WHITE, white), (Board.BLACK, black)):
+            if num:
+                self.add_spots(spots[colour], partition_spots, -1)
+
+        partitions = [partition for i, partition in enumerate(self.partitions) if i != removed]
+        return self.feature_vector(partitions, spots, reach, token_num, cell_num, own_sums, own_cells)
+
+    def boom_counts(self, cells):
+        """
+        token numbers, cell numbers, own token sums and own cells after the cells are boomed
+        """
+        own_sums = self.own_sums.copy()
+        token_num = self.token_num.copy()
+        cell_num = self.cell_num.copy()
+        for cell in cells.values():
+            token_num[cell.colour] -= cell.n
+            cell_num[cell.colour] -= 1
+            if cell.colour == self.colour:
+                self.add_own_sums(own_sums, cell.pos, cell.n, -1)
+
+        own_cells = [cell for cell in self.cells.values() if cell.colour == self.colour and cell.pos not in cells]
+        return token_num, cell_num, own_sums, own_cells
+
+    def move_feature_vector(self, n, pos, next_pos):
+        """
+        a move changes the partitions of pos and of the cells around next_pos,
+        these are rebuilt from their cells, the others are kept
+        """
+        cell = self.cells[pos]
+        next_cell = self.cells.get(next_pos)
+        colour = cell.colour
+        next_n = next_cell.n + n if next_cell else n
+
+        own_sums = self.own_sums.copy()
+        cell_num = self.cell_num.copy()
+        if cell.n == n:
+            cell_num[colour] -= 1
+        if not next_cell:
+            cell_num[colour] += 1
+
+        if colour == self.colour:
+            self.add_own_sums(own_sums, pos, cell.n, -1)
+            if cell.n > n:
+                self.add_own_sums(own_sums, pos, cell.n - n, 1)
+            if next_cell:
+                self.add_own_sums(own_sums, next_pos, next_cell.n, -1)
+            self.add_own_sums(own_sums, next_pos, next_n, 1)
+
+        if not self.with_partitions:
+            return self.feature_vector(None, None, None, self.token_num, cell_num, own_sums, None)
+
+        own_cells = [c for c in self.cells.values() if c.colour == self.colour and c.pos != pos and c.pos != next_pos]
+        if colour == self.colour:
+            if cell.n > n:
+                own_cells.append(Cell(pos[0], pos[1], cell.n - n, colour))
+            own_cells.append(Cell(next_pos[0], next_pos[1], next_n, colour))
+
+        reach = {Board.WHITE: dict(), Board.BLACK: dict()}
+        self.add_reach(reach[colour], pos, cell.n, -1)
+        if cell.n > n:
+            self.add_reach(reach[colour], pos, cell.n - n, 1)
+        if next_cell:
+            self.add_reach(reach[colour], next_pos, next_cell.n, -1)
+        self.add_reach(reach[colour], next_pos, next_n, 1)
+
+        # cells of the changed partitions after the move
+        changed = {self.partition_of[pos]}
+        changed.update(self.partition_of[p] for p in BoardUtil.surround[next_pos] if p in self.partition_of)
+        if next_cell:
+            changed.add(self.partition_of[next_pos])
+        cells = dict()
+        for i in changed:
+            cells.update(self.partitions[i][0])
+        del cells[pos]
+        if cell.n > n:
+            cells[pos] = Cell(pos[0], pos[1], cell.n - n, colour)
+        cells[next_pos] = Cell(next_pos[0], next_pos[1], next_n, colour)
+
+        spots = {Board.WHITE: self.spots[Board.WHITE].copy(), Board.BLACK: self.spots[Board.BLACK].copy()}
+        for i in changed:
+            _, white, black, partition_spots = self.partitions[i]
+            for side, num in ((Board.WHITE, white), (Board.BLACK, black)):
+                if num:
+                    self.add_spots(spots[side], partition_spots, -1)
+
+        partitions = [partition for i, partition in enumerate(self.partitions) if i not in changed]
+        while cells:
+            part = Board._connected(next(iter(cells)), cells)
+            for p in part:
+                del cells[p]
+            partition = self.new_partition(part)
+            partitions.append(partition)
+            for side, num in ((Board.WHITE, partition[1]), (Board.BLACK, partition[2])):
+                if num:
+                    self.add_spots(spots[side], partition[3], 1)
+
+        return self.feature_vector(partitions, spots, reach, self.token_num, cell_num, own_sums, own_cells)
+
+    def reached(self, reach_delta, colour, pos):
+        """
+        whether a cell of colour can move to pos after the action
+        Args:
+            reach_delta: change of self.reach[colour] made by the action
+        """
+        return self.reach[colour].get(pos, 0) + reach_delta.get(pos, 0) > 0
+
+    def vulnerability(self, partitions, spots, reach, colour):
+        """
+        the maximum partition token difference and the maximum vulnerability score of the partitions
+        containing tokens of colour, equal to BoardUtil.max_partition_token_diff and
+        BoardUtil.max_vulnerability_score
+        Returns:
+            tuple (partition token diff, vulnerability score, whether any spot is reached)
+        """
+        index, opponent_index = (1, 2) if colour == Board.WHITE else (2, 1)
+        opponent_colour = Board.BLACK if colour == Board.WHITE else Board.WHITE
+
+        max_diff = None
+        # the spots of a side can only be reached if it has a partition with more own tokens
+        reachable = False
+        for partition in partitions:
+            if partition[index]:
+                diff = partition[opponent_index] - partition[index]
+                if max_diff is None or diff > max_diff:
+                    max_diff = diff
+                if partition[index] > partition[opponent_index]:
+                    reachable = True
+        max_diff = max_diff if max_diff and max_diff > 0 else 0
+
+        max_score = 0
+        any_reached = False
+        if reachable:
+            for pos, value in spots.items():
+                if self.reached(reach[opponent_colour], opponent_colour, pos):
+                    any_reached = True
+                    token_diff = value[index - 1] - value[opponent_index - 1] - 1
+                    score = token_diff * PROBABILITY_TABLE.get(value[0] + value[1], 0.9)
+                    if score > max_score:
+                        max_score = score
+        return max_diff, max_score, any_reached
+
+    def feature_vector(self, partitions, spots, reach, token_num, cell_num, own_sums, own_cells):
+        """
+        features of the board after an action from its partitions, spots and token numbers
+        """
+        own_token_num = token_num[self.colour]
+        opponent_token_num = token_num[self.opponent_colour]
+
+        features = [
+            own_token_num - opponent_token_num,
+            own_sums[0] / own_token_num if own_token_num else 1,
+            own_sums[1] / own_token_num if own_token_num else 1,
+            own_sums[3] / (10 * cell_num[self.colour]) if cell_num[self.colour] else 0,
+            own_sums[2] if self.cost + 1 < 13 else 0,
+        ]
+
+        # the partition and vulnerability features
+        if partitions is None:
+            features += [0, 0, 0, 0, 0]
+        else:
+            own_partition_token_diff, own_vul_score, _ = \
+                self.vulnerability(partitions, spots[self.colour], reach, self.colour)
+            opponent_partition_token_diff, opponent_vul_score, opponent_reached = \
+                self.vulnerability(partitions, spots[self.opponent_colour], reach, self.opponent_colour)
+            features += [
+                own_partition_token_diff,
+                opponent_partition_token_diff,
+                own_vul_score,
+                opponent_vul_score,
+                self.leftover_chasing(own_token_num - opponent_token_num, cell_num[self.opponent_colour],
+                                      spots[self.opponent_colour], opponent_reached, own_cells),
+            ]
+        return [value / 10 for value in features]
+
+    @staticmethod
+    def leftover_chasing(token_diff, opponent_cell_num, spots, reached, own_cells):
+        """
+        equal to BoardUtil.opponent_leftover_chasing
+        """
+        # chase when we have advantage, only when we can't reach opponent's vulnerability
+        if (token_diff > 3 or (token_diff >= 0 and opponent_cell_num < 3)) and not reached:
+            return BoardUtil.chasing_score(own_cells, spots)
+        return 0
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+multi-core evaluation of the actions of large positions, a persistent pool of worker
+processes is sent the board bytes (see Board.to_bytes) and ranges of action ids
+(see agent.action_table), each worker returns the best actions of its range
+"""
+
+import os
+import random
+from agent.board import Board
+from agent.action_table import ACTIONS, ACTION_IDS
+from agent.feature_state import FeatureState
+
+# board class of the worker process, set by _init_worker
+_board_class = None
+
+
+def _init_worker(board_class):
+    """
+    warm up a worker process, the BoardUtil tables are built when agent.board_util is imported
+    """
+    global _board_class
+    # imported lazily by the player, import it once here instead of on the first task
+    import numpy
+    _board_class = board_class
+
+
+def _evaluate_range(data, action_ids, weights, partitions):
+    """
+    Args:
+        data: bytes of the board, see Board.to_bytes
+        action_ids: list of action ids
+        weights: weight vector in the order of FEATURE_NAMES, 0 for the dropped features
+        partitions: whether to compute the partition features, see FeatureState
+    Returns:
+        tuple (max Q value, list of the action ids with the max Q value)
+    """
+    import numpy as np
+
+    state = FeatureState(_board_class.from_bytes(data), partitions=partitions)
+    q_values = np.array([state.get_feature_vector(ACTIONS[i]) for i in action_ids]) @ weights
+    max_value = q_values.max()
+    return max_value, [action_ids[i] for i in np.flatnonzero(q_values == max_value)]
+
+
+class ParallelEvaluator:
+    """
+    pool of worker processes choosing the best action of a board,
+    positions with fewer actions than the threshold should be evaluated serially,
+    multiprocessing is imported when the pool is created to keep the player startup fast
+    """
+    def __init__(self, processes=None, threshold=128, board_class=Board):
+        """
+        Args:
+            processes: number of worker processes, the number of cores by default
+            threshold: minimum number of actions worth sending to the workers
+            board_class: board engine of the workers, Board or BitBoard
+        """
+        from multiprocessing import Pool
+
+        self.processes = processes or os.cpu_count() or 1
+        self.threshold = threshold
+        self.pool = Pool(self.processes, initializer=_init_worker, initargs=(board_class,))
+
+    def is_worth(self, actions):
+        return len(actions) >= self.threshold
+
+    def choose_action(self, board, actions, weights, partitions=True):
+        """
+        Args:
+            board: Board object
+            actions: list of valid action tuples
+            weights: numpy weight vector in the order of FEATURE_NAMES, 0 for the dropped features
+            partitions: whether to compute the partition features, see FeatureState
+        Returns:
+            an action with the max Q value, chosen randomly among the equal ones
+        """
+        data = board.to_bytes()
+        action_ids = [ACTION_IDS[action] for action in actions]
+        size = -(-len(action_ids) // self.processes)
+        ranges = [action_ids[i:i + size] for i in range(0, len(action_ids), size)]
+        results = self.pool.starmap(_evaluate_range, [(data, ids, weights, partitions) for ids in ranges])
+
+        best_value = max([value for value, _ in results])
+        best_ids = [i for value, ids in results if value == best_value for i in ids]
+        return ACTIONS[best_ids[random.randint(0, len(best_ids) - 1)]]
+
+    def close(self):
+        """
+        stop the worker processes
+        """
+        self.pool.close()
+        self.pool.join()
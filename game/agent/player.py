@@ -4,15 +4,51 @@
 from agent.q_learning_table import ApproximateQLearning
 from agent.board import Board
 from agent.board_util import BoardUtil
+from agent.parallel_evaluator import ParallelEvaluator
 import os
 import json
+import time
+
+# fraction of the time budget left at which the player drops to the cheap features
+TIME_RESERVE = 0.2
+
+
+class CpuClock:
+    """
+    context manager accumulating the CPU time spent inside it, the referee's
+    _CountdownTimer isn't visible to the player so it keeps its own count of
+    the process time of __init__, action and update
+    """
+    def __init__(self, budget=None):
+        """
+        Args:
+            budget: CPU time limit of the game in seconds, None or 0 for unlimited
+        """
+        self.budget = budget
+        self.clock = 0
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.clock += time.process_time() - self.start
+
+    def is_running_low(self, reserve=TIME_RESERVE):
+        """
+        Returns:
+            whether less than a reserve fraction of the budget is left
+        """
+        return bool(self.budget) and self.budget - self.clock < reserve * self.budget
 
 
 class TrainingPlayer:
     """
     An agent used to train the model using approximate Q learning
     """
-    def __init__(self, colour):
+    def __init__(self, colour, board_class=Board, time_budget=None, replay_capacity=0, batch_size=32,
+                 q_table=None, write_values=True):
         """
         This method is called once at the beginning of the game to initialise
         your player. You should use this opportunity to set up your own internal
@@ -22,23 +58,34 @@ class TrainingPlayer:
         The parameter colour will be a string representing the player your 
         program will play as (White or Black). The value will be one of the 
         strings "white" or "black" correspondingly.
-        """
-        self.colour = colour
-        self.last_action = None
-        self.last_board = None
-
-        dir_path = os.path.dirname(os.path.realpath(__file__))
-        value_file_name = "white-weights.json" if colour == "white" else "black-weights.json"
-        value_file_path = os.path.join(dir_path, value_file_name)
-        initial_board_data = os.path.join(dir_path, "initial-board.json")
-        board_util_data = os.path.join(dir_path, "board-util-data.json")
 
-        with open(initial_board_data) as board_file, open(board_util_data) as util_file:
-            BoardUtil.initialize(json.load(util_file))
-
-            board_data = json.load(board_file)
-            self.q_table = ApproximateQLearning(value_file_path, epsilon=0.9)
-            self.board = Board(board_data, colour)
+        board_class selects the board engine, Board or the bitboard backed BitBoard.
+        time_budget is the CPU time limit of the game in seconds, None for unlimited.
+        replay_capacity enables learning mini-batches of batch_size transitions from a replay
+        buffer of that many transitions, 0 learns every transition once.
+        q_table is an ApproximateQLearning kept across games, e.g. by SelfPlay, a new one
+        is loaded from the value file by default.
+        write_values writes the value file at the end of the game.
+        """
+        self.clock = CpuClock(time_budget)
+        with self.clock:
+            self.colour = colour
+            self.last_action = None
+            self.last_board = None
+            self.write_values = write_values
+
+            dir_path = os.path.dirname(os.path.realpath(__file__))
+            value_file_name = "white-weights.json" if colour == "white" else "black-weights.json"
+            value_file_path = os.path.join(dir_path, value_file_name)
+            initial_board_data = os.path.join(dir_path, "initial-board.json")
+
+            with open(initial_board_data) as board_file:
+                board_data = json.load(board_file)
+                if q_table is None:
+                    q_table = ApproximateQLearning(value_file_path, epsilon=0.9, replay_capacity=replay_capacity,
+                                                   batch_size=batch_size)
+                self.q_table = q_table
+                self.board = board_class(board_data, colour)
 
     def action(self):
         """
@@ -49,8 +96,11 @@ class TrainingPlayer:
         return an allowed action to play on this turn. The action must be
         represented based on the spec's instructions for representing actions.
         """
-        self.last_action = self.q_table.choose_action(self.board)
-        self.last_board = self.board.copy()
+        with self.clock:
+            if self.clock.is_running_low():
+                self.q_table.use_cheap_features()
+            self.last_action = self.q_table.choose_action(self.board)
+            self.last_board = self.board.copy()
         return self.last_action
 
     def update(self, colour, action):
@@ -71,49 +121,72 @@ class TrainingPlayer:
         for the player colour (your method does not need to validate the action
         against the game rules).
         """
-        next_board = self.board.copy()
-        next_board.take_action(action)
+        with self.clock:
+            record = self.board.take_action(action, undoable=True)
 
-        isMe = colour == self.colour
-        terminal = len(next_board.get_white_cells()) == 0 or len(next_board.get_black_cells()) == 0
+            isMe = colour == self.colour
+            terminal = len(self.board.get_white_cells()) == 0 or len(self.board.get_black_cells()) == 0
 
-        if terminal and isMe:
-            reward = BoardUtil.evaluate_round(self.board, next_board, None, action, None, self.colour)
-            self.q_table.learn(self.board, next_board, action, reward)
-        elif not isMe and self.last_board:
-            reward = BoardUtil.evaluate_round(self.last_board, self.board, next_board, self.last_action, action, self.colour)
-            self.q_table.learn(self.last_board, next_board, self.last_action, reward)
+            # the board before the action is only needed for learning, keep the updated board otherwise
+            if (terminal and isMe) or (not isMe and self.last_board):
+                next_board = self.board.copy()
+                self.board.undo(record)
 
-        if terminal:
-            self.q_table.write_value_file()
+                if terminal and isMe:
+                    reward = BoardUtil.evaluate_round(self.board, next_board, None, action, None, self.colour)
+                    self.q_table.learn(self.board, next_board, action, reward)
+                else:
+                    reward = BoardUtil.evaluate_round(self.last_board, self.board, next_board, self.last_action, action,
+                                                      self.colour)
+                    self.q_table.learn(self.last_board, next_board, self.last_action, reward)
+                self.board = next_board
 
-        self.board = next_board
+            if terminal and self.write_values:
+                self.q_table.write_value_file()
 
 
 class GamePlayer:
     """
     The practical agent using the trained data to play the game
     """
-    def __init__(self, colour):
-        self.colour = colour
-        self.last_action = None
-        self.last_board = None
-
-        dir_path = os.path.dirname(os.path.realpath(__file__))
-        value_file_name = "white-weights.json" if colour == "white" else "black-weights.json"
-        value_file_path = os.path.join(dir_path, value_file_name)
-        initial_board_data = os.path.join(dir_path, "initial-board.json")
-        board_util_data = os.path.join(dir_path, "board-util-data.json")
-
-        with open(initial_board_data) as board_file, open(board_util_data) as util_file:
-            BoardUtil.initialize(json.load(util_file))
-
-            board_data = json.load(board_file)
-            self.q_table = ApproximateQLearning(value_file_path, epsilon=1)
-            self.board = Board(board_data, colour)
+    def __init__(self, colour, board_class=Board, time_budget=60.0, move_time=None, processes=0, prune=False,
+                 evaluator=None):
+        """
+        time_budget is the CPU time limit of the game in seconds, the referee's -t value,
+        None for unlimited.
+        move_time is the CPU time limit of an action in seconds, the best action evaluated
+        in time is played, None evaluates every action.
+        processes is the number of worker processes evaluating the positions with many actions,
+        0 evaluates every position in this process.
+        prune drops the dominated split moves before evaluating, see BoardUtil.is_dominated_split.
+        evaluator is an evaluator shared with other players, e.g. a client of an EvaluationServer,
+        it replaces the worker processes.
+        """
+        self.clock = CpuClock(time_budget)
+        with self.clock:
+            self.colour = colour
+            self.last_action = None
+            self.last_board = None
+
+            dir_path = os.path.dirname(os.path.realpath(__file__))
+            value_file_name = "white-weights.json" if colour == "white" else "black-weights.json"
+            value_file_path = os.path.join(dir_path, value_file_name)
+            initial_board_data = os.path.join(dir_path, "initial-board.json")
+
+            with open(initial_board_data) as board_file:
+                board_data = json.load(board_file)
+                if evaluator is None and processes:
+                    evaluator = ParallelEvaluator(processes, board_class=board_class)
+                self.q_table = ApproximateQLearning(value_file_path, epsilon=1, move_time=move_time,
+                                                    evaluator=evaluator, prune=prune)
+                self.board = board_class(board_data, colour)
 
     def action(self):
-        return self.q_table.choose_action(self.board)
+        with self.clock:
+            if self.clock.is_running_low():
+                self.q_table.use_cheap_features()
+            return self.q_table.choose_action(self.board)
 
     def update(self, colour, action):
-        self.board.take_action(action)
\ No newline at end of file
+        with self.clock:
+            self.board.take_action(action)
\ No newline at end of file
@@ -1,121 +1,602 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import numpy as np
 import random
 import json
+from collections import OrderedDict
+from time import perf_counter, process_time
+from agent.board import Board
 from agent.board_util import BoardUtil
+from agent.feature_state import FeatureState
+from agent.feature_registry import FeatureRegistry
+from agent.replay_buffer import ReplayBuffer
+
+# feature names in the column order of the feature vectors and the weight vector
+FEATURE_NAMES = (
+    "token-diff",
+    "marginal-rate",
+    "cornered-rate",
+    "average-stack-score",
+    "early-non-bottom-num",
+    "max-own-partition-token-diff",
+    "max-opponent-partition-token-diff",
+    "own-vulnerability-reachability",
+    "opponent-vulnerability-reachability",
+    "opponent-leftover-chasing",
+)
+
+# number of actions evaluated between two deadline checks of the anytime action selection
+ANYTIME_SLICE = 16
+
+# the features and the values they depend on, see FeatureRegistry
+FEATURES = FeatureRegistry()
+
+
+@FEATURES.register("own-token-cell-num")
+def _own_token_cell_num(board, values):
+    return BoardUtil.analyse(board).get_token_cell_num(board.colour)
+
+
+@FEATURES.register("opponent-token-cell-num")
+def _opponent_token_cell_num(board, values):
+    return BoardUtil.analyse(board).get_token_cell_num(board.opponent_colour)
+
+
+@FEATURES.register("own-partitions", cheap=False)
+def _own_partitions(board, values):
+    return BoardUtil.partitions_and_vulnerable_spots(board, True)
+
+
+@FEATURES.register("opponent-partitions", cheap=False)
+def _opponent_partitions(board, values):
+    return BoardUtil.partitions_and_vulnerable_spots(board, False)
+
+
+@FEATURES.register("token-diff", ["own-token-cell-num", "opponent-token-cell-num"])
+def _token_diff(board, values):
+    return values["own-token-cell-num"][0] - values["opponent-token-cell-num"][0]
+
+
+@FEATURES.register("marginal-rate", ["own-token-cell-num"])
+def _marginal_rate(board, values):
+    own_token_num = values["own-token-cell-num"][0]
+    return BoardUtil.own_marginal_token_num(board) / own_token_num if own_token_num else 1
+
+
+@FEATURES.register("cornered-rate", ["own-token-cell-num"])
+def _cornered_rate(board, values):
+    own_token_num = values["own-token-cell-num"][0]
+    return BoardUtil.own_cornered_token_num(board) / own_token_num if own_token_num else 1
+
+
+@FEATURES.register("average-stack-score")
+def _average_stack_score(board, values):
+    return BoardUtil.average_stack_score(board)
+
+
+@FEATURES.register("early-non-bottom-num")
+def _early_non_bottom_num(board, values):
+    return BoardUtil.early_non_bottom_num(board)
+
+
+@FEATURES.register("max-own-partition-token-diff", ["own-partitions"])
+def _max_own_partition_token_diff(board, values):
+    return BoardUtil.max_partition_token_diff(values["own-partitions"][0], board.colour)
+
+
+@FEATURES.register("max-opponent-partition-token-diff", ["opponent-partitions"])
+def _max_opponent_partition_token_diff(board, values):
+    return BoardUtil.max_partition_token_diff(values["opponent-partitions"][0], board.opponent_colour)
+
+
+@FEATURES.register("own-vulnerability-reachability", ["own-partitions"])
+def _own_vulnerability_reachability(board, values):
+    return BoardUtil.max_vulnerability_score(values["own-partitions"][1], board.colour)
+
+
+@FEATURES.register("opponent-vulnerability-reachability", ["opponent-partitions"])
+def _opponent_vulnerability_reachability(board, values):
+    return BoardUtil.max_vulnerability_score(values["opponent-partitions"][1], board.opponent_colour)
+
+
+@FEATURES.register("opponent-leftover-chasing", ["opponent-partitions"])
+def _opponent_leftover_chasing(board, values):
+    return BoardUtil.opponent_leftover_chasing(board, values["opponent-partitions"][1])
+
+
+class FeatureCache:
+    """
+    bounded LRU cache of feature vectors, feature vectors don't depend on the weights
+    so the cache stays valid while learning
+    """
+    def __init__(self, size):
+        """
+        Args:
+            size: maximum number of feature vectors, 0 disables the cache
+        """
+        self.size = size
+        self.vectors = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def get_key(board, action_key):
+        """
+        key of the board after taking an action, the features depend on the cells,
+        the own colour and whether the game is in the early stage (cost < 13)
+        Args:
+            board: Board object
+            action_key: zobrist key of the board after the action, see Board.get_action_key
+        Returns:
+            hashable key
+        """
+        return action_key, board.colour, board.cost + 1 < 13
+
+    def get(self, key):
+        """
+        Returns:
+            feature vector, None if it is not cached
+        """
+        vector = self.vectors.get(key)
+        if vector is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.vectors.move_to_end(key)
+        return vector
+
+    def put(self, key, vector):
+        if not self.size:
+            return
+        self.vectors[key] = vector
+        if len(self.vectors) > self.size:
+            self.vectors.popitem(last=False)
+            self.evictions += 1
+
+    def get_stats(self):
+        """
+        Returns:
+            dict of the cache counters
+        """
+        total = self.hits + self.misses
+        return {"size": len(self.vectors), "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "hit-rate": self.hits / total if total else 0}
 
 
 class ApproximateQLearning:
-    def __init__(self, values_file, epsilon=1):
+    """
+    approximate Q learning with a linear function of the board features,
+    numpy is imported when the first batch of actions is evaluated to keep the player startup fast
+    """
+    def __init__(self, values_file, epsilon=1, incremental=True, cache_size=4096, move_time=None,
+                 evaluator=None, tactics=True, prune=False, replay_capacity=0, batch_size=32):
         # learning rate
         self.alpha = 0.01
         # reward decay
         self.gamma = 0.9
         # e-greedy
         self.epsilon = epsilon
+        # derive the features of every action from a FeatureState of the board instead of applying it
+        self.incremental = incremental
+        # feature vectors of recently evaluated boards, see FeatureCache
+        self.feature_cache = FeatureCache(cache_size)
+        # the computed features, the others are 0, see set_feature_names()
+        self.feature_names = FEATURE_NAMES
+        self.dropped_indices = []
+        self.cheap_only = False
+        # CPU time limit of choose_action in seconds, None evaluates every action, see choose_action()
+        self.move_time = move_time
+        # ParallelEvaluator for the positions with many actions, None evaluates serially
+        self.evaluator = evaluator
+        # check for a winning boom or forced replies before evaluating, see get_tactical_actions()
+        self.tactics = tactics
+        # drop the dominated split moves before evaluating, see prune_actions()
+        self.prune = prune
+        self.pruned_num = 0
+        # learn mini-batches of stored transitions instead of each transition once, see learn()
+        self.replay_buffer = ReplayBuffer(replay_capacity, len(FEATURE_NAMES)) if replay_capacity else None
+        self.batch_size = batch_size
+        # FeatureState of the last evaluated board, see get_feature_state()
+        self.feature_state = None
+        self.feature_state_key = None
 
         self.value_file = values_file
         with open(values_file, 'r') as file:
             self.weights = {k: float(v) for k, v in json.load(file).items()}
+        # weights in the order of FEATURE_NAMES, see get_weight_vector()
+        self.weight_vector = None
 
     def choose_action(self, board):
         """
-        choose an action by the Q table
+        choose an action by the Q table, with a move time the actions are evaluated
+        in heuristic order and the best action found before the deadline is returned
         Args:
             board: Board object with valid actions
         Returns:
             a valid action
         """
-        valid_actions = board.get_valid_actions()
+        import numpy as np
+
+        if random.random() < self.epsilon:
+            valid_actions = board.get_valid_actions()
+            if self.tactics:
+                valid_actions = self.get_tactical_actions(board, valid_actions)
+                if len(valid_actions) == 1:
+                    return valid_actions[0]
+            if self.prune:
+                valid_actions = self.prune_actions(board, valid_actions)
+
+            if self.move_time is not None:
+                return self.choose_action_anytime(board, valid_actions, process_time() + self.move_time)
+
+            if self.evaluator is not None and self.evaluator.is_worth(valid_actions):
+                weights = self.get_weight_vector().copy()
+                weights[self.dropped_indices] = 0
+                return self.evaluator.choose_action(board, valid_actions, weights, not self.cheap_only)
 
-        if np.random.uniform() < self.epsilon:
             # pick the action with the maximum value
             # find all the actions with the same max q value
-            max_indices = [0]
-            max_value = self.get_q_value_for_action(board, valid_actions[0])
-            for i, action in enumerate(valid_actions[1:]):
-                value = self.get_q_value_for_action(board, action)
-                if value > max_value:
-                    max_indices = [i + 1]
-                    max_value = value
-                elif value == max_value:
-                    max_indices.append(i + 1)
+            q_values = self.get_q_values(board, valid_actions)
+            max_indices = np.flatnonzero(q_values == q_values.max())
 
             # randomly pick an action with max q value
             action = valid_actions[max_indices[random.randint(0, len(max_indices) - 1)]]
         else:
             # random action for learning
+            valid_actions = board.get_valid_actions()
             action = valid_actions[random.randint(0, len(valid_actions) - 1)]
         return action
 
+    @staticmethod
+    def get_tactical_actions(board, actions):
+        """
+        cheap tactical pass before the evaluation: a boom winning the game is played at once,
+        when the opponent threatens to remove every own token with one boom only the actions
+        escaping the threat are kept
+        Args:
+            board: Board object
+            actions: list of valid action tuples
+        Returns:
+            list of the actions worth evaluating, a single action is the forced choice
+        """
+        action = BoardUtil.winning_boom(board)
+        if action is not None:
+            return [action]
+
+        if len(actions) > 1 and BoardUtil.is_threatened(board):
+            escapes = []
+            for action in actions:
+                record = board.take_action(action, undoable=True)
+                if not BoardUtil.is_threatened(board):
+                    escapes.append(action)
+                board.undo(record)
+            # every action loses, leave the choice to the evaluation
+            if escapes:
+                return escapes
+        return actions
+
+    def prune_actions(self, board, actions):
+        """
+        drop the split moves dominated by BoardUtil.is_dominated_split, the number of dropped
+        actions is added to pruned_num
+        Args:
+            board: Board object
+            actions: list of valid action tuples
+        Returns:
+            list of the remaining actions, all of them if every action is dominated
+        """
+        remaining = [action for action in actions if not BoardUtil.is_dominated_split(board, action)]
+        if not remaining:
+            return actions
+        self.pruned_num += len(actions) - len(remaining)
+        return remaining
+
+    def choose_action_anytime(self, board, actions, deadline):
+        """
+        evaluate the actions in slices of ANYTIME_SLICE in the order of get_ordered_actions,
+        keeping the best so far, until every action is evaluated or the deadline has passed,
+        the first slice is always evaluated
+        Args:
+            board: Board object
+            actions: list of valid action tuples
+            deadline: time.process_time() value
+        Returns:
+            the action with the maximum Q value among the evaluated ones
+        """
+        import numpy as np
+
+        actions = self.get_ordered_actions(board, actions)
+        best_actions = []
+        best_value = None
+        for start in range(0, len(actions), ANYTIME_SLICE):
+            if start and process_time() > deadline:
+                break
+            batch = actions[start:start + ANYTIME_SLICE]
+            q_values = self.get_q_values(board, batch)
+            max_value = q_values.max()
+            if best_value is None or max_value > best_value:
+                best_value = max_value
+                best_actions = []
+            if max_value == best_value:
+                best_actions += [batch[i] for i in np.flatnonzero(q_values == max_value)]
+
+        return best_actions[random.randint(0, len(best_actions) - 1)]
+
+    @staticmethod
+    def get_ordered_actions(board, actions=None):
+        """
+        valid actions in a cheap heuristic order: booms killing opponent tokens, by the number
+        of killed tokens, then full-stack moves, partial moves and the other booms
+        Args:
+            board: Board object
+            actions: list of the valid actions to order, all of them by default
+        Returns:
+            list of action tuples
+        """
+        kills = []
+        moves = []
+        booms = []
+        included = None if actions is None else set(actions)
+        for action in board.iter_valid_actions(Board.PRIORITY_ORDER):
+            if included is not None and action not in included:
+                continue
+            if action[0] == "BOOM":
+                killed = sum([cell.n for cell in board.get_connected_cells(*action[1])
+                              if cell.colour == board.opponent_colour])
+                if killed:
+                    kills.append((killed, action))
+                else:
+                    booms.append(action)
+            else:
+                moves.append(action)
+        kills.sort(key=lambda item: item[0], reverse=True)
+        return [action for _, action in kills] + moves + booms
+
     def learn(self, board, next_board, action, reward):
         """
-        update Q table values after taking an action
+        update Q table values after taking an action, with a replay buffer the
+        transition is stored and a mini-batch of stored transitions is learned instead
         Args:
             board: current Board object
             next_board: Board object of the next step
             action: action tuple
             reward: reward value
         """
-        q_predict = self.get_q_value_for_action(board, action)
+        if self.replay_buffer is not None:
+            self.remember(board, next_board, action, reward)
+            self.replay(self.batch_size)
+            return
+
+        features = self.get_feature_matrix(board, [action])[0]
+        weight_vector = self.get_weight_vector()
+
+        q_predict = features @ weight_vector
         q_target = reward + self.gamma * self.get_max_q_value(next_board)
         diff = self.alpha * (q_target - q_predict)
 
         # update weights
-        for name, value in self.get_features(board, action).items():
-            self.weights[name] += diff * value
+        weight_vector += diff * features
+        for name, weight in zip(FEATURE_NAMES, weight_vector.tolist()):
+            self.weights[name] = weight
+
+    def remember(self, board, next_board, action, reward):
+        """
+        store a transition in the replay buffer, the next feature vector is the one
+        of the best action of the next board under the current weights
+        Args:
+            board: current Board object
+            next_board: Board object of the next step
+            action: action tuple
+            reward: reward value
+        """
+        import numpy as np
+
+        features = self.get_feature_matrix(board, [action])[0]
+        next_actions = next_board.get_valid_actions()
+        if next_actions:
+            next_matrix = self.get_feature_matrix(next_board, next_actions)
+            next_features = next_matrix[(next_matrix @ self.get_weight_vector()).argmax()]
+        else:
+            next_features = np.zeros(len(FEATURE_NAMES))
+        self.replay_buffer.add(features, reward, next_features)
+
+    def replay(self, batch_size):
+        """
+        learn a mini-batch of the replay buffer, the TD errors of the batch are
+        computed at once and their mean update is applied to the weights
+        Args:
+            batch_size: number of sampled transitions
+        """
+        if not len(self.replay_buffer):
+            return
+        features, rewards, next_features = self.replay_buffer.sample(batch_size)
+        weight_vector = self.get_weight_vector()
+
+        diffs = self.alpha * (rewards + self.gamma * (next_features @ weight_vector) - features @ weight_vector)
+        # the weights dict is updated when the value file is written
+        weight_vector += diffs @ features / batch_size
+
+    def sync_weights(self):
+        """
+        copy the weight vector to the weights dict written to the value file
+        """
+        if self.weight_vector is not None:
+            self.weights = dict(zip(FEATURE_NAMES, self.weight_vector.tolist()))
+
+    def set_feature_names(self, names):
+        """
+        compute only some of the features, the others are 0 so their weights don't contribute
+        Args:
+            names: feature names, a subset of FEATURE_NAMES
+        """
+        names = tuple([name for name in FEATURE_NAMES if name in names])
+        if names != self.feature_names:
+            self.feature_names = names
+            self.dropped_indices = [i for i, name in enumerate(FEATURE_NAMES) if name not in names]
+            self.cheap_only = all([FEATURES.is_cheap(name) for name in names])
+            # the cached vectors were computed with other features
+            self.feature_cache.vectors.clear()
+
+    def use_cheap_features(self):
+        """
+        drop to the features that don't need the partition analysis, e.g. when running out of time
+        """
+        self.set_feature_names(FEATURES.get_cheap_names(FEATURE_NAMES))
 
     def get_features(self, board, action):
-        features = dict()
-        next_board = board.copy()
-        next_board.take_action(action)
-        own_token_num, own_cell_num = next_board.own_token_cell_num()
-        opponent_token_num, opponent_cell_num = next_board.opponent_token_cell_num()
-        own_marginal_token_num = BoardUtil.own_marginal_token_num(next_board)
-        own_cornered_token_num = BoardUtil.own_cornered_token_num(next_board)
-
-        features["token-diff"] = own_token_num - opponent_token_num
-        features["marginal-rate"] = own_marginal_token_num / own_token_num if own_token_num else 1
-        features["cornered-rate"] = own_cornered_token_num / own_token_num if own_token_num else 1
-        features["average-stack-score"] = BoardUtil.average_stack_score(next_board)
-        features["early-non-bottom-num"] = BoardUtil.early_non_bottom_num(next_board)
-
-        # partition token diff
-        own_partitions, own_vul_spots = BoardUtil.partitions_and_vulnerable_spots(next_board, True)
-        opponent_partitions, opponent_vul_spots = BoardUtil.partitions_and_vulnerable_spots(next_board, False)
-        own_partition_token_diff = BoardUtil.max_partition_token_diff(own_partitions, next_board.colour)
-        opponent_partition_token_diff = BoardUtil.max_partition_token_diff(opponent_partitions, next_board.opponent_colour)
-        features["max-own-partition-token-diff"] = own_partition_token_diff
-        features["max-opponent-partition-token-diff"] = opponent_partition_token_diff
-
-        # vulnerable spots
-        own_vul_score = BoardUtil.max_vulnerability_score(own_vul_spots, next_board.colour)
-        opponent_vul_score = BoardUtil.max_vulnerability_score(opponent_vul_spots, next_board.opponent_colour)
-        features["own-vulnerability-reachability"] = own_vul_score
-        features["opponent-vulnerability-reachability"] = opponent_vul_score
-        features["opponent-leftover-chasing"] = BoardUtil.opponent_leftover_chasing(next_board, opponent_vul_spots)
-
-        for name, value in features.items():
-            features[name] /= 10
-
-        return features
+        """
+        features of the board after taking an action
+        Args:
+            board: Board object
+            action: action tuple
+        Returns:
+            dict of feature values
+        """
+        return dict(zip(FEATURE_NAMES, self.get_feature_vector(board, action)))
+
+    def get_feature_vector(self, board, action):
+        """
+        features of the board after taking an action, the action is applied
+        in place and undone afterwards instead of copying the board
+        Args:
+            board: Board object
+            action: action tuple
+        Returns:
+            list of feature values in the order of FEATURE_NAMES
+        """
+        record = board.take_action(action, undoable=True)
+        try:
+            return self.get_board_feature_vector(board, self.feature_names)
+        finally:
+            board.undo(record)
+
+    def get_feature_matrix(self, board, actions, action_keys=None):
+        """
+        features of the boards after taking each of the actions, looked up in the feature cache first
+        Args:
+            board: Board object
+            actions: list of action tuples
+            action_keys: keys of the boards after the actions if known, see Board.get_action_key
+        Returns:
+            numpy array of shape (len(actions), len(FEATURE_NAMES))
+        """
+        import numpy as np
+
+        matrix = np.empty((len(actions), len(FEATURE_NAMES)))
+        cache = self.feature_cache
+        if cache.size and action_keys is None:
+            action_keys = [board.get_action_key(action) for action in actions]
+        state = None
+        for i, action in enumerate(actions):
+            key = cache.get_key(board, action_keys[i]) if cache.size else None
+            vector = cache.get(key) if cache.size else None
+            if vector is None:
+                if not self.incremental:
+                    vector = self.get_feature_vector(board, action)
+                else:
+                    start = perf_counter()
+                    # looked up on the first miss only
+                    if state is None:
+                        state = self.get_feature_state(board)
+                    vector = state.get_feature_vector(action)
+                    FEATURES.record("feature-state", perf_counter() - start)
+                cache.put(key, vector)
+            matrix[i] = vector
+
+        if self.dropped_indices:
+            matrix[:, self.dropped_indices] = 0
+        return matrix
+
+    def get_feature_state(self, board):
+        """
+        FeatureState of a board, kept while the same board object is evaluated in the
+        same state, e.g. over the slices of choose_action_anytime()
+        Args:
+            board: Board object
+        Returns:
+            FeatureState object
+        """
+        key = (board.key, board.colour, board.cost, self.cheap_only)
+        if self.feature_state is None or self.feature_state.board is not board or self.feature_state_key != key:
+            self.feature_state = FeatureState(board, partitions=not self.cheap_only)
+            self.feature_state_key = key
+        return self.feature_state
+
+    @staticmethod
+    def get_board_features(next_board):
+        """
+        features of a board reached by an action
+        Args:
+            next_board: Board object
+        Returns:
+            dict of feature values
+        """
+        return dict(zip(FEATURE_NAMES, ApproximateQLearning.get_board_feature_vector(next_board)))
+
+    @staticmethod
+    def get_board_feature_vector(next_board, names=FEATURE_NAMES):
+        """
+        features of a board reached by an action, computed by the feature registry
+        Args:
+            next_board: Board object
+            names: tuple of the features to compute, the others are 0
+        Returns:
+            list of feature values in the order of FEATURE_NAMES
+        """
+        values = FEATURES.evaluate(next_board, names)
+        return [values[name] / 10 if name in values else 0 for name in FEATURE_NAMES]
+
+    def get_weight_vector(self):
+        """
+        Returns:
+            numpy array of the weights in the order of FEATURE_NAMES
+        """
+        import numpy as np
+
+        if self.weight_vector is None:
+            self.weight_vector = np.array([self.weights[name] for name in FEATURE_NAMES])
+        return self.weight_vector
+
+    def get_q_values(self, board, actions):
+        """
+        Q values of a batch of actions, a single matrix-vector product of
+        the feature matrix and the weight vector, actions leading to the same
+        board (e.g. booms in the same partition) are evaluated once
+        Args:
+            board: Board object
+            actions: list of action tuples
+        Returns:
+            numpy array of Q values in the order of actions
+        """
+        # index of the distinct next board of every action
+        distinct = dict()
+        distinct_actions = []
+        distinct_keys = []
+        indices = []
+        for action in actions:
+            key = board.get_action_key(action)
+            if key not in distinct:
+                distinct[key] = len(distinct_actions)
+                distinct_actions.append(action)
+                distinct_keys.append(key)
+            indices.append(distinct[key])
+
+        q_values = self.get_feature_matrix(board, distinct_actions, distinct_keys) @ self.get_weight_vector()
+        return q_values[indices]
 
     def get_q_value_for_action(self, board, action):
-        q_value = 0
-        for name, value in self.get_features(board, action).items():
-            q_value += self.weights[name] * value
-        return q_value
+        return self.get_q_values(board, [action])[0]
 
     def get_max_q_value(self, board):
-        values = [self.get_q_value_for_action(board, action) for action in board.get_valid_actions()]
-        return max(values) if values else 0
+        actions = board.get_valid_actions()
+        return self.get_q_values(board, actions).max() if actions else 0
 
     def write_value_file(self):
         """
         write Q table to the file
         """
+        self.sync_weights()
         with open(self.value_file, 'w') as file:
             data = json.dumps(self.weights)
             file.write(data)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+fixed-capacity experience replay buffer of approximate Q learning, the transitions
+are stored in numpy arrays so a mini-batch is sampled and learned with vectorized operations
+"""
+
+
+class ReplayBuffer:
+    """
+    ring buffer of transitions (feature vector, reward, next feature vector), the next
+    feature vector is the one of the best action of the next board, zeros if the game is over,
+    the oldest transition is overwritten when the buffer is full
+    """
+    def __init__(self, capacity, feature_num):
+        """
+        Args:
+            capacity: maximum number of transitions
+            feature_num: length of the feature vectors
+        """
+        import numpy as np
+
+        self.capacity = capacity
+        self.features = np.zeros((capacity, feature_num))
+        self.rewards = np.zeros(capacity)
+        self.next_features = np.zeros((capacity, feature_num))
+        # number of stored transitions and index of the next one
+        self.size = 0
+        self.index = 0
+
+    def add(self, features, reward, next_features):
+        """
+        Args:
+            features: feature vector of the action taken
+            reward: reward value
+            next_features: feature vector of the best action of the next board
+        """
+        self.features[self.index] = features
+        self.rewards[self.index] = reward
+        self.next_features[self.index] = next_features
+        self.index = (self.index + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def sample(self, batch_size):
+        """
+        Args:
+            batch_size: number of transitions, drawn uniformly with replacement
+        Returns:
+            tuple of numpy arrays (features, rewards, next_features)
+        """
+        import numpy as np
+
+        indices = np.random.randint(0, self.size, batch_size)
+        return self.features[indices], self.rewards[indices], self.next_features[indices]
+
+    def __len__(self):
+        return self.size
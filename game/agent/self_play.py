@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+self-play training in a single process, two TrainingPlayers sharing one ApproximateQLearning
+of each colour across games play on the agent's own boards, without the referee
+"""
+
+import os
+from collections import Counter
+from time import perf_counter
+from agent.board import Board
+from agent.player import TrainingPlayer
+from agent.q_learning_table import ApproximateQLearning
+
+# draw rules of the referee: the number of turns of each player and the number of
+# times a game state may occur
+MAX_TURNS = 250
+MAX_REPEATS = 4
+
+
+class SelfPlay:
+    """
+    plays training games in this process, the weights stay in memory and are written
+    to the value files at every checkpoint
+    """
+    def __init__(self, board_class=Board, checkpoint=100, replay_capacity=0, batch_size=32):
+        """
+        Args:
+            board_class: board engine of the players, Board or BitBoard
+            checkpoint: number of games between two writes of the value files, 0 only writes at the end
+            replay_capacity, batch_size: replay buffer of the Q tables, see ApproximateQLearning
+        """
+        self.board_class = board_class
+        self.checkpoint = checkpoint
+        dir_path = os.path.dirname(os.path.realpath(__file__))
+        self.q_tables = {
+            colour: ApproximateQLearning(os.path.join(dir_path, colour + "-weights.json"), epsilon=0.9,
+                                         replay_capacity=replay_capacity, batch_size=batch_size)
+            for colour in (Board.WHITE, Board.BLACK)
+        }
+        # number of played games and their results, key: winner colour or "draw"
+        self.game_num = 0
+        self.results = Counter()
+
+    def play_game(self):
+        """
+        play a game, the players learn every transition
+        Returns:
+            tuple of the winner colour ("draw" for a draw) and the number of turns
+        """
+        players = {colour: TrainingPlayer(colour, self.board_class, q_table=q_table, write_values=False)
+                   for colour, q_table in self.q_tables.items()}
+        # the game state is the white player's board, with the parity of the turn
+        board = players[Board.WHITE].board
+        history = Counter({(board.key, 0): 1})
+        colour = Board.WHITE
+        turns = 0
+        while True:
+            action = players[colour].action()
+            for player in players.values():
+                player.update(colour, action)
+            board = players[Board.WHITE].board
+            turns += 1
+
+            white_num = board.white_token_cell_num()[0]
+            black_num = board.black_token_cell_num()[0]
+            if not white_num or not black_num:
+                winner = Board.WHITE if white_num else Board.BLACK if black_num else "draw"
+                break
+            state = (board.key, turns % 2)
+            history[state] += 1
+            if turns >= MAX_TURNS * 2 or history[state] >= MAX_REPEATS:
+                winner = "draw"
+                break
+            colour = Board.BLACK if colour == Board.WHITE else Board.WHITE
+
+        self.game_num += 1
+        self.results[winner] += 1
+        return winner, turns
+
+    def train(self, games, report=print):
+        """
+        play games, write the value files at every checkpoint and at the end
+        Args:
+            games: number of games
+            report: function called with a progress line at every checkpoint, None for silence
+        Returns:
+            games per second
+        """
+        start = perf_counter()
+        for i in range(1, games + 1):
+            self.play_game()
+            if self.checkpoint and i % self.checkpoint == 0 and i < games:
+                self.save()
+                if report is not None:
+                    report(self.get_report(i, perf_counter() - start))
+        self.save()
+        elapsed = perf_counter() - start
+        if report is not None:
+            report(self.get_report(games, elapsed))
+        return games / elapsed if elapsed else 0
+
+    def get_report(self, games, elapsed):
+        """
+        Returns:
+            progress line of the played games
+        """
+        return "{} games, white {} black {} draw {}, {:.2f} games/s".format(
+            games, self.results[Board.WHITE], self.results[Board.BLACK], self.results["draw"],
+            games / elapsed if elapsed else 0)
+
+    def save(self):
+        """
+        write the weights to the value files
+        """
+        for q_table in self.q_tables.values():
+            q_table.write_value_file()
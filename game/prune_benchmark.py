@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+compare the GamePlayer with dominated split moves pruned against the unpruned one:
+win rate of the pruned player, CPU time per own turn of both players (including the
+updates, as the referee counts it) and the number of pruned actions,
+the players swap colours every game
+run from the game directory:
+    python prune_benchmark.py [games]
+"""
+
+import random
+import sys
+from referee.game import Game
+from agent.player import GamePlayer
+
+GAMES = 10
+
+
+def play(players):
+    """
+    play a game in this process
+    Args:
+        players: dict, key: colour, value: player
+    Returns:
+        tuple of the winner colour (None for a draw) and the number of turns
+    """
+    game = Game()
+    colour = "white"
+    turns = 0
+    while not game.over():
+        action = players[colour].action()
+        game.update(colour, action)
+        for player in players.values():
+            player.update(colour, action)
+        colour = "black" if colour == "white" else "white"
+        turns += 1
+
+    result = game.end()
+    for winner in ("white", "black"):
+        if "winner: " + winner in result:
+            return winner, turns
+    return None, turns
+
+
+if __name__ == "__main__":
+    games = int(sys.argv[1]) if len(sys.argv) > 1 else GAMES
+    results = {"pruned": 0, "unpruned": 0, "draw": 0}
+    times = {"pruned": [0.0, 0], "unpruned": [0.0, 0]}
+    pruned_num = 0
+
+    for i in range(games):
+        random.seed(i)
+        pruned_colour = "white" if i % 2 == 0 else "black"
+        unpruned_colour = "black" if pruned_colour == "white" else "white"
+        pruned = GamePlayer(pruned_colour, time_budget=None, prune=True)
+        unpruned = GamePlayer(unpruned_colour, time_budget=None)
+        winner, turns = play({pruned_colour: pruned, unpruned_colour: unpruned})
+
+        results["draw" if winner is None else "pruned" if winner == pruned_colour else "unpruned"] += 1
+        for name, player in (("pruned", pruned), ("unpruned", unpruned)):
+            times[name][0] += player.clock.clock
+            times[name][1] += (turns + (player.colour == "white")) // 2
+        pruned_num += pruned.q_table.pruned_num
+        print("game {}: pruned player {}, {} turns, winner: {}".format(i + 1, pruned_colour, turns, winner or "draw"))
+
+    print("pruned wins {pruned}, unpruned wins {unpruned}, draws {draw}".format(**results))
+    for name, (clock, actions) in times.items():
+        print("{:<10}{:>10.2f}ms per turn".format(name, clock / actions * 1000 if actions else 0))
+    print("pruned actions: {}".format(pruned_num))
@@ -131,6 +131,18 @@ def _NEAR_SQUARES(square):
             (x-1,y-1),(x,y-1),(x+1,y-1)} & _ALL_SQUARES
 
 _MAX_TURNS = 250 # per player
+
+_MAX_STACK = 12 # all tokens of one colour
+
+# Canonical action tuples, built once and shared by every call to
+# _available_actions instead of allocating new tuples:
+_BOOM_ACTIONS = {xy: ("BOOM", xy) for xy in _ALL_SQUARES}
+_NEXT_SQUARES_TABLE = {(xy, d): _NEXT_SQUARES(xy, d)
+                       for xy in _ALL_SQUARES for d in range(1, _MAX_STACK+1)}
+_MOVE_ACTIONS = {(xy, next_xy): tuple(("MOVE", m, xy, next_xy)
+                                      for m in range(1, _MAX_STACK+1))
+                 for xy in _ALL_SQUARES for d in range(1, 8)
+                 for next_xy in _NEXT_SQUARES(xy, d)}
  
 
 
@@ -232,14 +244,13 @@ class Game:
         else:
             stacks = -self.board
         for square in stacks.keys():
-            available_actions.append(("BOOM", square))
+            available_actions.append(_BOOM_ACTIONS[square])
         for square, n in stacks.items():
             for d in range(1, n+1):
-                for next_square in _NEXT_SQUARES(square, d):
+                for next_square in _NEXT_SQUARES_TABLE[square, d]:
                     if next_square in stacks or self.board[next_square] == 0:
-                        for m in range(1, n+1):
-                            move_action = ("MOVE", m, square, next_square)
-                            available_actions.append(move_action)
+                        moves = _MOVE_ACTIONS[square, next_square]
+                        available_actions.extend(moves[:n])
         return available_actions
 
     def _turn_detect_draw(self):
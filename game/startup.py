@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+report the startup cost of the agent: importing agent.player and constructing
+the players, measured in a fresh interpreter like the referee starts them
+run from the game directory:
+    python startup.py
+"""
+
+from subprocess import check_output
+import sys
+
+MEASURE = '''
+from time import perf_counter, process_time
+wall, cpu = perf_counter(), process_time()
+from agent.player import {player}
+import_wall, import_cpu = perf_counter() - wall, process_time() - cpu
+wall, cpu = perf_counter(), process_time()
+{player}("{colour}")
+init_wall, init_cpu = perf_counter() - wall, process_time() - cpu
+print(import_wall, import_cpu, init_wall, init_cpu)
+'''
+
+ROUNDS = 5
+
+if __name__ == "__main__":
+    print("{:<16}{:<8}{:>14}{:>14}{:>14}{:>14}".format(
+        "player", "colour", "import wall", "import cpu", "init wall", "init cpu"))
+    for player in ("GamePlayer", "TrainingPlayer"):
+        for colour in ("white", "black"):
+            totals = [0.0] * 4
+            for i in range(ROUNDS):
+                output = check_output([sys.executable, "-c", MEASURE.format(player=player, colour=colour)])
+                totals = [total + float(value) for total, value in zip(totals, output.split())]
+            print("{:<16}{:<8}".format(player, colour)
+                  + "".join("{:>12.1f}ms".format(total / ROUNDS * 1000) for total in totals))
@@ -3,7 +3,7 @@
 # an agent using user input for every move to play against another agent,
 # this agent is used to test the 'agent' module
 
-from agent.board import BoardUtil, Board
+from agent.board import Board
 from agent.player import TrainingPlayer
 import os
 import json
@@ -21,11 +21,8 @@ class Player:
         self.player = TrainingPlayer(self.colour)
         dir_path = os.path.dirname(os.path.realpath(__file__))
         initial_board_data = os.path.join(dir_path, "initial-board.json")
-        board_util_data = os.path.join(dir_path, "board-util-data.json")
-
-        with open(initial_board_data) as board_file, open(board_util_data) as util_file:
-            BoardUtil.initialize(json.load(util_file))
 
+        with open(initial_board_data) as board_file:
             board_data = json.load(board_file)
             self.board = Board(board_data, colour)
 
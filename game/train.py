@@ -1,8 +1,19 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+"""
+train the agent by self-play in this process, see agent.self_play
+run from the game directory:
+    python train.py [games] [checkpoint]
+checkpoint is the number of games between two writes of the weight files
+"""
 
-from subprocess import call
+import sys
+from agent.self_play import SelfPlay
 
-for i in range(1500):
-    # call(['python', '-m', 'referee', 'agent', 'agent'], shell=False)
-    call(['python', '-m', 'referee', 'test', 'agent'], shell=False)
+GAMES = 1500
+CHECKPOINT = 100
+
+if __name__ == "__main__":
+    games = int(sys.argv[1]) if len(sys.argv) > 1 else GAMES
+    checkpoint = int(sys.argv[2]) if len(sys.argv) > 2 else CHECKPOINT
+    SelfPlay(checkpoint=checkpoint).train(games)
@@ -8,17 +8,13 @@ from search.board_util import BoardUtil
 from search.util import print_board
 from search.blind_search import bfs, dfs
 from search.heuristic_search import wastar
-from search.q_learning_table import QLearningTable
 import os
 
 dir_path = os.path.dirname(os.path.realpath(__file__))
 
 
 def main():
-    board_data_file = os.path.join(dir_path, "board-util-data.json")
-    with open(sys.argv[1]) as file, open(board_data_file) as board_file:
-        BoardUtil.initialize(json.load(board_file))
-
+    with open(sys.argv[1]) as file:
         data = json.load(file)
         board = Board(data)
 
@@ -32,6 +28,9 @@ def main():
 
 
 def q_learning(board):
+    # imported here so the searches do not pay for loading pandas
+    from search.q_learning_table import QLearningTable
+
     ql = QLearningTable(os.path.join(dir_path, "level-1.csv"))
 
     while True:
@@ -20,7 +20,7 @@ def depth_first_search(board):
             return current
 
         explored.add(current)
-        for action in current.get_valid_actions():
+        for action in current.iter_valid_actions():
             newNode = current.copy()
             newNode.take_action(action)
 
@@ -50,7 +50,7 @@ def breath_first_search(board):
         if len(current.get_black_cells()) == 0:
             return current
 
-        for action in current.get_valid_actions():
+        for action in current.iter_valid_actions():
             new_node = current.copy()
             new_node.take_action(action)
 
@@ -5,7 +5,9 @@ define data structure of Board and Cell and static utility methods
 """
 
 from copy import deepcopy
+import random
 from search.board_util import BoardUtil
+from search.action_table import ACTION_IDS, BOOM_ACTIONS, MOVE_ACTIONS
 
 
 class Cell:
@@ -33,6 +35,18 @@ class Cell:
         return type(self)(self.x, self.y, self.n, self.colour)
 
 
+def _zobrist_table(seed):
+    """
+    random 64-bit keys of every (colour, position, stack height),
+    a fixed seed keeps the keys stable between runs
+    Returns:
+        list indexed by colour, of dict of key: (x, y), value: list of keys indexed by stack height
+    """
+    generator = random.Random(seed)
+    return [{(x, y): [generator.getrandbits(64) for n in range(13)] for x in range(8) for y in range(8)}
+            for colour in range(2)]
+
+
 class Board:
     """
     board object
@@ -40,6 +54,17 @@ class Board:
     WHITE = 0
     BLACK = 1
 
+    # bytes of Board.to_bytes: 64 squares (signed token number, positive for white),
+    # turn (0 for white, 1 for black) and cost (2 bytes, big endian)
+    BYTES_LENGTH = 67
+
+    # orders of Board.iter_valid_actions
+    BOARD_ORDER = "board"
+    PRIORITY_ORDER = "priority"
+
+    # zobrist keys for incremental hashing
+    ZOBRIST = _zobrist_table(20200517)
+
     def __init__(self, data=None):
         """
         Args:
@@ -65,6 +90,11 @@ class Board:
                 n, x, y = token[0], token[1], token[2]
                 self.board[(x, y)] = Cell(x, y, n, Board.BLACK)
 
+        # zobrist key of the board, updated on every move and boom
+        self.key = 0
+        for cell in self.board.values():
+            self.key ^= Board.ZOBRIST[cell.colour][cell.pos][cell.n]
+
     def take_action(self, action):
         """
         pre-condition: action is valid
@@ -88,16 +118,22 @@ class Board:
         """
         start_cell = self.board[(x, y)]
         des_cell = self.board.get((next_x, next_y), Cell(next_x, next_y, 0, start_cell.colour))
+        keys = Board.ZOBRIST[start_cell.colour]
 
         # update destination cell
+        if des_cell.n:
+            self.key ^= keys[des_cell.pos][des_cell.n]
         des_cell.n += n
+        self.key ^= keys[des_cell.pos][des_cell.n]
         self.board[(next_x, next_y)] = des_cell
 
         # update start cell
+        self.key ^= keys[start_cell.pos][start_cell.n]
         if start_cell.n == n:
             self.board.pop((x, y))
         else:
             start_cell.n -= n
+            self.key ^= keys[start_cell.pos][start_cell.n]
 
     def boom(self, x, y):
         """
@@ -105,6 +141,7 @@ class Board:
         a token or stack boom at (x, y)
         """
         for cell in self.get_connected_cells(x, y):
+            self.key ^= Board.ZOBRIST[cell.colour][cell.pos][cell.n]
             self.board.pop(cell.pos)
 
     def get_connected_cells(self, x, y):
@@ -134,23 +171,66 @@ class Board:
         find all valid actions in a single turn,
         include all valid moves and boom
         """
+        return list(self.iter_valid_actions())
+
+    def iter_valid_actions(self, order=None):
+        """
+        lazily generate the valid actions in a single turn, the board must be
+        unchanged whenever the generator resumes
+        Args:
+            order: Board.BOARD_ORDER for the order of get_valid_actions,
+                Board.PRIORITY_ORDER for booms first, then full-stack moves,
+                then partial splits from the largest to the smallest
+        Returns:
+            generator of action tuples
+        """
         cells = self.get_white_cells() if self.turn == Board.WHITE else self.get_black_cells()
-        actions = []
 
-        # find all moves
-        for cell in cells:
-            x, y = cell.pos
-            n, color = cell.n, cell.colour
+        if order == Board.PRIORITY_ORDER:
+            for cell in cells:
+                yield BOOM_ACTIONS[cell.pos]
 
+            targets = [(cell, self.get_move_targets(cell)) for cell in cells]
+            for cell, next_positions in targets:
+                for next_pos in next_positions:
+                    yield MOVE_ACTIONS[cell.pos][next_pos][cell.n - 1]
+
+            for i in range(max([cell.n for cell in cells], default=1) - 1, 0, -1):
+                for cell, next_positions in targets:
+                    if cell.n > i:
+                        for next_pos in next_positions:
+                            yield MOVE_ACTIONS[cell.pos][next_pos][i - 1]
+            return
+
+        for cell in cells:
             # boom at this position
-            actions.append((0, x, y, -1, -1))
+            yield BOOM_ACTIONS[cell.pos]
 
             # find all valid moves
-            for (nextX, nextY) in BoardUtil.cardinal[(x, y)][n]:
-                if (nextX, nextY) not in self.board or color == self.board[(nextX, nextY)].colour:
-                    actions += [(i, x, y, nextX, nextY) for i in range(1, n + 1)]
+            moves = MOVE_ACTIONS[cell.pos]
+            for next_pos in self.get_move_targets(cell):
+                yield from moves[next_pos][:cell.n]
 
-        return actions
+    def get_valid_action_ids(self, order=None):
+        """
+        integer ids of the valid actions, see search.action_table
+        Args:
+            order: order of the actions, see Board.iter_valid_actions
+        Returns:
+            list of action ids
+        """
+        return [ACTION_IDS[action] for action in self.iter_valid_actions(order)]
+
+    def get_move_targets(self, cell):
+        """
+        positions a cell can move to, not occupied by the opponent
+        Args:
+            cell: own cell
+        Returns:
+            list of positions
+        """
+        return [pos for pos in BoardUtil.cardinal[cell.pos][cell.n]
+                if pos not in self.board or cell.colour == self.board[pos].colour]
 
     def get_white_cells(self):
         """
@@ -168,6 +248,43 @@ class Board:
         """
         return list(filter(lambda cell: cell.colour == Board.BLACK, self.board.values()))
 
+    def to_bytes(self):
+        """
+        fixed-size encoding of the board, see Board.BYTES_LENGTH
+        Returns:
+            bytes object, can be used as a cache key
+        """
+        data = bytearray(Board.BYTES_LENGTH)
+        for cell in self.board.values():
+            # signed byte, positive for white, negative for black
+            data[cell.y * 8 + cell.x] = cell.n if cell.colour == Board.WHITE else 256 - cell.n
+        data[64] = self.turn
+        data[65:67] = self.cost.to_bytes(2, "big")
+        return bytes(data)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        decode a board encoded by to_bytes, cells are created in square order,
+        parent and last action are not encoded
+        Args:
+            data: bytes of Board.BYTES_LENGTH
+        Returns:
+            board object
+        """
+        tokens = {"white": [], "black": []}
+        for i in range(64):
+            if data[i]:
+                if data[i] < 128:
+                    tokens["white"].append([data[i], i % 8, i // 8])
+                else:
+                    tokens["black"].append([256 - data[i], i % 8, i // 8])
+
+        board = cls(tokens)
+        board.turn = data[64]
+        board.cost = int.from_bytes(data[65:67], "big")
+        return board
+
     def copy(self):
         return deepcopy(self)
 
@@ -180,10 +297,11 @@ class Board:
         board.last_action = self.last_action
         board.turn = self.turn
         board.cost = self.cost
+        board.key = self.key
         return board
 
     def __hash__(self):
-        return hash(str(self.board))
+        return self.key
 
     def __repr__(self):
         return str(sorted(self.board.items(), key=lambda t: t[1]))
@@ -192,4 +310,4 @@ class Board:
         return self.cost < other.cost
 
     def __eq__(self, other):
-        return isinstance(other, Board) and self.board == other.board
+        return isinstance(other, Board) and self.key == other.key and self.board == other.board
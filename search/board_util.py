@@ -4,28 +4,70 @@
 from search.util import print_board, print_boom, print_move
 
 
+def _build_adjacent_data():
+    """
+    pre-calculate the adjacent cells of every cell, the same data as board-util-data.json
+    Returns:
+        tuple of cardinal and surround dict with position tuple keys
+    """
+    cardinal = dict()
+    surround = dict()
+
+    cardinal_dirs = [(0, 1), (0, -1), (1, 0), (-1, 0)]
+    surround_dirs = [(1, -1), (1, 0), (1, 1), (0, 1), (0, -1), (-1, -1), (-1, 0), (-1, 1)]
+
+    for x in range(8):
+        for y in range(8):
+            cardinal[(x, y)] = dict()
+            accumulation = []
+            for step in range(1, 13):
+                for direction in cardinal_dirs:
+                    next_x, next_y = x + direction[0] * step, y + direction[1] * step
+                    if -1 < next_x < 8 and -1 < next_y < 8:
+                        accumulation.append((next_x, next_y))
+                cardinal[(x, y)][step] = accumulation.copy()
+
+            surround[(x, y)] = [(x + dx, y + dy) for dx, dy in surround_dirs if -1 < x + dx < 8 and -1 < y + dy < 8]
+    return cardinal, surround
+
+
 class BoardUtil:
     """
     static utility methods or objects for Board
     """
 
-    cardinal = dict()
-    surround = dict()
+    # adjacent cell data of every cell, built at import time,
+    # initialize() replaces it with the data of a board-util-data.json
+    cardinal, surround = _build_adjacent_data()
 
     @staticmethod
     def initialize(data):
         """
-        parse board-util-data.json which contains the adjacent cell data of every cell
+        parse board-util-data.json which contains the adjacent cell data of every cell,
+        the same data is already built at import time so this is optional
         Args:
             data: json data from board-util-data.json
         """
+        cardinal = dict()
         for pos, steps in data["cardinal"].items():
-            BoardUtil.cardinal[eval(pos)] = dict()
-            for step, cells in steps.items():
-                BoardUtil.cardinal[eval(pos)][int(step)] = [eval(cell) for cell in cells]
+            cardinal[BoardUtil.parse_pos(pos)] = {int(step): [BoardUtil.parse_pos(cell) for cell in cells]
+                                                  for step, cells in steps.items()}
+
+        BoardUtil.cardinal = cardinal
+        BoardUtil.surround = {BoardUtil.parse_pos(pos): [BoardUtil.parse_pos(cell) for cell in cells]
+                              for pos, cells in data["surround"].items()}
 
-        for pos, cells in data["surround"].items():
-            BoardUtil.surround[eval(pos)] = [eval(cell) for cell in cells]
+    @staticmethod
+    def parse_pos(text):
+        """
+        parse a position string of board-util-data.json
+        Args:
+            text: position string, e.g. "(1, 2)"
+        Returns:
+            position tuple
+        """
+        x, y = text.strip("()").split(",")
+        return int(x), int(y)
 
     @staticmethod
     def validPos(x, y):
@@ -28,7 +28,7 @@ def astar_search(board):
         if len(current.get_black_cells()) == 0:
             return current
 
-        for action in current.get_valid_actions():
+        for action in current.iter_valid_actions():
             newNode = current.copy()
             newNode.take_action(action)
             if newNode not in explored:
@@ -59,7 +59,7 @@ def weighted_astar_search(board):
         if len(current.get_black_cells()) == 0:
             return current
 
-        for action in current.get_valid_actions():
+        for action in current.iter_valid_actions():
             new_node = current.copy()
             new_node.take_action(action)
             if new_node not in explored:
@@ -12,11 +12,8 @@ import os
 
 def main():
     dir_path = os.path.dirname(os.path.realpath(__file__))
-    board_data_file = os.path.join(dir_path, "board-util-data.json")
-
-    with open(sys.argv[1]) as file, open(board_data_file) as board_file:
-        BoardUtil.initialize(json.load(board_file))
 
+    with open(sys.argv[1]) as file:
         data = json.load(file)
         board = Board(data)
         print_board(board.board, compact=False)